@@ -0,0 +1,107 @@
+"""Local stand-ins for YouTube: a fake ``YoutubeDL.extract_info`` and a fake googlevideo server."""
+import itertools
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AUDIO_BYTES = 512 * 1024
+_AUDIO = bytes(range(256)) * (AUDIO_BYTES // 256)
+_url_ids = itertools.count()  # every extraction signs a new URL, as YouTube does
+
+# request paths answered with 403, like a signed URL that expired or is bound to another IP
+REVOKED = set()
+
+
+# --------------------------------------------------
+# googlevideo: signed-URL-ish audio with Range support
+# --------------------------------------------------
+class _AudioHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path in REVOKED:
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body, status, extra = _AUDIO, 200, {}
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        if match:
+            start = int(match[1])
+            end = int(match[2]) if match[2] else len(_AUDIO) - 1
+            body, status = _AUDIO[start:end + 1], 206
+            extra["Content-Range"] = f"bytes {start}-{end}/{len(_AUDIO)}"
+        self.send_response(status)
+        self.send_header("Content-Type", "audio/mp4")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        for key, value in extra.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_googlevideo() -> str:
+    """Serve fake audio on a free local port; returns the base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _AudioHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-googlevideo", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --------------------------------------------------
+# yt-dlp
+# --------------------------------------------------
+def install(latency: float, payload_kb: int, googlevideo: str):
+    """Replace ``yt_dlp.YoutubeDL.extract_info`` with a fake that sleeps ``latency``
+    seconds and returns info dicts padded to roughly ``payload_kb`` KiB (the
+    real ones are mostly the ``formats`` list)."""
+    import yt_dlp
+
+    # ~250 bytes per format entry
+    format_count = max(1, payload_kb * 4)
+
+    def formats(video_id: str, expire: int):
+        return [
+            {
+                "format_id": str(i),
+                "ext": "m4a" if i % 2 else "webm",
+                "acodec": "mp4a.40.2",
+                "abr": 128 + i,
+                "filesize": 3_000_000 + i,
+                "url": f"{googlevideo}/videoplayback?expire={expire}&id={video_id}&itag={i}",
+            }
+            for i in range(format_count)
+        ]
+
+    def extract_info(self, url, download=False, **kwargs):
+        time.sleep(latency)
+        expire = int(time.time()) + 6 * 3600
+        if url.startswith("ytsearch"):
+            count, query = url[len("ytsearch"):].split(":", 1)
+            return {"entries": [
+                {"id": f"s{zlib.crc32(f'{query}:{i}'.encode()):010d}", "title": f"{query} {i}", "uploader": "Bench"}
+                for i in range(int(count or 1))
+            ]}
+        video_id = url.split("v=")[-1] if "v=" in url else url[-11:]
+        return {
+            "id": video_id,
+            "title": f"Track {video_id}",
+            "uploader": "Bench Artist",
+            "duration": 200,
+            "thumbnail": f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",
+            "ext": "m4a",
+            "url": f"{googlevideo}/videoplayback?expire={expire}&id={video_id}&n={next(_url_ids)}",
+            "formats": formats(video_id, expire),
+            "related_videos": [
+                {"id": f"r{video_id[:4]}{i:06d}", "title": f"Related {i}", "uploader": "Bench"}
+                for i in range(15)
+            ],
+        }
+
+    yt_dlp.YoutubeDL.extract_info = extract_info
@@ -0,0 +1,279 @@
+"""Load-test the API against a fake YouTube backend and compare with a stored baseline.
+
+Run from backend/:
+
+    python -m benchmarks.run                      # all scenarios, compare with baseline.json
+    python -m benchmarks.run -c 32 -n 500 --latency 0.2 stream upnext
+    python -m benchmarks.run --save-baseline      # record the current numbers
+
+The API runs in a subprocess (uvicorn, real HTTP) with ``extract_info``
+replaced by benchmarks/fake_youtube.py, so numbers cover routing, caching,
+coalescing and the extraction pool but not YouTube itself. Cold ``import main``
+time and the time until /healthz and /readyz answer are tracked as well. Exits with status
+1 when a scenario is slower than the baseline by more than ``--tolerance``.
+Baselines are machine-specific: record one on the machine that compares.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+BACKEND = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def video_id(i: int) -> str:
+    return f"bench{i:06d}"
+
+
+# --------------------------------------------------
+# Scenarios: (i, offset) -> (method, path, request kwargs)
+# ``distinct`` keys are cycled, so each round starts cold and then exercises
+# the caches; ``offset`` gives every round its own keys.
+# --------------------------------------------------
+def scenarios(distinct: int, playlist_id: int):
+    def key(i, offset):
+        return offset + i % distinct
+
+    return {
+        "stream": lambda i, o: ("GET", "/stream", {"params": {"url": video_id(key(i, o))}}),
+        "track_info": lambda i, o: ("GET", "/track_info", {"params": {"video_id": video_id(key(i, o))}}),
+        "search": lambda i, o: ("GET", "/search", {"params": {"q": f"bench query {key(i, o)}"}}),
+        "upnext": lambda i, o: ("GET", "/autoplay/upnext", {"params": {"videoId": video_id(key(i, o))}}),
+        "audio": lambda i, o: ("GET", f"/stream/audio/{video_id(key(i, o))}", {"headers": {"Range": "bytes=0-65535"}}),
+        "playlist_add": lambda i, o: ("POST", "/playlist/add", {"json": {
+            "playlist_id": playlist_id, "videoId": video_id(o + i), "title": f"Track {i}", "artist": "Bench Artist",
+        }}),
+        "playlist_all": lambda i, o: ("GET", "/playlist/all", {}),
+        "like": lambda i, o: ("POST", "/like", {"params": {"videoId": video_id(key(i, o)), "title": f"Track {i}"}}),
+        "liked_all": lambda i, o: ("GET", "/liked/all", {}),
+    }
+
+
+def _one(base: str, request) -> tuple:
+    method, path, kwargs = request
+    start = time.perf_counter()
+    try:
+        resp = _session().request(method, base + path, timeout=60, **kwargs)
+        ok = resp.status_code < 400
+        resp.content
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[k]
+
+
+def run_round(base: str, build, total: int, concurrency: int, offset: int) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: _one(base, build(i, offset)), range(total)))
+    elapsed = time.perf_counter() - start
+    latencies = [secs for secs, _ in results]
+    return {
+        "requests": total,
+        "errors": sum(1 for _, ok in results if not ok),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def run_scenario(base: str, build, total: int, concurrency: int, rounds: int) -> dict:
+    """Median of each figure over ``rounds`` runs (errors are summed), to damp scheduler noise."""
+    runs = [run_round(base, build, total, concurrency, offset=r * total) for r in range(rounds)]
+    result = {k: sorted(run[k] for run in runs)[len(runs) // 2] for k in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+    return {"requests": total * rounds, "errors": sum(run["errors"] for run in runs), **result}
+
+
+# --------------------------------------------------
+# Server process
+# --------------------------------------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int):
+    """Resident memory of ``pid`` in MiB (Linux only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def measure_import(workdir: str, runs: int) -> float:
+    """Median wall time of a fresh interpreter running ``import main``."""
+    env = dict(os.environ, NEBULA_CATALOG=os.path.join(workdir, "catalog.db"),
+               NEBULA_AUDIO_CACHE_DIR=os.path.join(workdir, "audio_cache"))
+    code = f"import sys; sys.path.insert(0, {str(BACKEND)!r}); import main"
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, check=True)
+        times.append(time.perf_counter() - start)
+    return round(sorted(times)[len(times) // 2], 3)
+
+
+def _wait_for(proc, url: str, deadline: float) -> bool:
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Benchmark server exited with status {proc.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def start_server(args, workdir: str):
+    """Start the API; returns (process, base URL, seconds until live, seconds until ready).
+
+    Both times include the fake backend's own yt_dlp import (it has to patch it).
+    """
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", "--port", str(port), "--workdir", workdir,
+         "--latency", str(args.latency), "--payload-kb", str(args.payload_kb)],
+        cwd=BACKEND,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    if _wait_for(proc, base + "/healthz", deadline):
+        live = time.perf_counter() - started
+        if _wait_for(proc, base + "/readyz", deadline):
+            return proc, base, round(live, 3), round(time.perf_counter() - started, 3)
+    proc.kill()
+    raise SystemExit("Benchmark server did not become ready within 60s")
+
+
+# --------------------------------------------------
+# Baseline comparison
+# --------------------------------------------------
+def compare(results: dict, baseline: dict, tolerance: float):
+    failures = []
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{name}: {current['rps']} req/s < baseline {base['rps']}")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {current['p95_ms']}ms > baseline {base['p95_ms']}ms")
+        if current["errors"] > base.get("errors", 0):
+            failures.append(f"{name}: {current['errors']} errors (baseline {base.get('errors', 0)})")
+    for name, current in results.get("startup", {}).items():
+        base = baseline.get("startup", {}).get(name)
+        # 0.2s of slack: interpreter start-up jitter dominates at this scale
+        if base is not None and current > base * (1 + tolerance) + 0.2:
+            failures.append(f"startup {name}: {current}s > baseline {base}s")
+    growth, base_growth = results.get("rss_growth_mb"), baseline.get("rss_growth_mb")
+    if growth is not None and base_growth is not None:
+        # small absolute slack so a tiny baseline does not make the check flaky
+        if growth > base_growth * (1 + tolerance) + 5:
+            failures.append(f"memory: grew {growth} MiB > baseline {base_growth} MiB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help="subset of scenarios to run (default: all)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per scenario; the median is reported")
+    parser.add_argument("--distinct", type=int, default=50, help="distinct videos/queries per scenario")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake extraction")
+    parser.add_argument("--payload-kb", type=int, default=50, help="approximate size of each fake info dict")
+    parser.add_argument("--startup-runs", type=int, default=3, help="cold imports timed; the median is reported")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed regression, as a fraction")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="nebula-bench-")
+    import_s = measure_import(workdir, args.startup_runs)
+    proc, base, live_s, ready_s = start_server(args, workdir)
+    try:
+        playlist_id = requests.post(base + "/playlist/create", json={"name": "bench"}, timeout=10).json()["id"]
+        available = scenarios(args.distinct, playlist_id)
+        unknown = set(args.scenarios) - set(available)
+        if unknown:
+            raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        rss_start = rss_mb(proc.pid)
+        results = {
+            "config": {k: getattr(args, k) for k in ("concurrency", "requests", "rounds", "distinct", "latency", "payload_kb")},
+            "startup": {"import_s": import_s, "live_s": live_s, "ready_s": ready_s},
+            "scenarios": {},
+        }
+        print(f"startup: import {import_s}s, live after {live_s}s, ready after {ready_s}s")
+        print(f"{'scenario':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name in args.scenarios or available:
+            r = run_scenario(base, available[name], args.requests, args.concurrency, args.rounds)
+            results["scenarios"][name] = r
+            print(f"{name:<14}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+        rss_end = rss_mb(proc.pid)
+        if rss_start is not None and rss_end is not None:
+            results["rss_growth_mb"] = round(rss_end - rss_start, 1)
+            print(f"server RSS {rss_start} -> {rss_end} MiB (+{results['rss_growth_mb']})")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("config") != results["config"]:
+        print("Note: baseline was recorded with a different configuration.")
+    failures = compare(results, baseline, args.tolerance)
+    if failures:
+        print("Regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
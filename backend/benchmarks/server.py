@@ -0,0 +1,43 @@
+"""Run the API against the fake YouTube backend (started by benchmarks/run.py).
+
+    python -m benchmarks.server --port 8765 --workdir /tmp/nebula-bench --latency 0.05 --payload-kb 50
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--workdir", required=True, help="scratch dir for library files, catalog and audio cache")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake extraction")
+    parser.add_argument("--payload-kb", type=int, default=50, help="approximate size of each fake info dict")
+    args = parser.parse_args()
+
+    # everything main.py writes goes to the scratch dir, never to the real library
+    workdir = Path(args.workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault("NEBULA_CATALOG", str(workdir / "catalog.db"))
+    os.environ.setdefault("NEBULA_AUDIO_CACHE_DIR", str(workdir / "audio_cache"))
+    # the fake backend answers in milliseconds; pacing it would only measure the limiter
+    os.environ.setdefault("NEBULA_UPSTREAM_RATE", "1000")
+    os.environ.setdefault("NEBULA_UPSTREAM_BURST", "1000")
+    os.chdir(workdir)
+    sys.path.insert(0, str(BACKEND))
+
+    from benchmarks.fake_youtube import install, start_googlevideo
+
+    install(args.latency, args.payload_kb, start_googlevideo())
+
+    import uvicorn
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,39 @@
 # lyrics_service.py
+import os
 import random
 import html
+from functools import lru_cache
+from urllib.parse import quote
 from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 import requests
+from requests.adapters import HTTPAdapter
+from utils.cache import TTLCache, SharedCache, TieredCache, SHARED_CACHE_PATH, normalize_query
+from utils.extractor import SingleFlight
+from utils.metrics import timed
 
 router = APIRouter(prefix="/lyrics", tags=["Lyrics"])
 
+LYRICS_API = os.getenv("NEBULA_LYRICS_API", "https://api.lyrics.ovh/v1")
+LYRICS_TIMEOUT = (3, 6)  # connect, read
+LYRICS_TTL = 60 * 60 * 24 * 30
+LYRICS_MISS_TTL = 60 * 60 * 6  # the API has no lyrics for this song
+LYRICS_ERROR_TTL = 60 * 5  # the API failed (timeout, 5xx); retry soon
+LYRICS_CACHE_PATH = os.getenv("NEBULA_LYRICS_CACHE", SHARED_CACHE_PATH or "data/cache.db")
+
+# keep-alive connections to the lyrics API instead of a new one per request
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_maxsize=8, max_retries=0))
+session.mount("http://", HTTPAdapter(pool_maxsize=8, max_retries=0))
+
+# always backed by SQLite so known lyrics (and known misses) survive restarts
+_lyrics_cache = TieredCache(
+    TTLCache(maxsize=2000, ttl=LYRICS_TTL, name="lyrics"),
+    SharedCache(LYRICS_CACHE_PATH, "lyrics"),
+)
+_lyrics_flight = SingleFlight()
+
 # Simple templates for generating synthetic lyrics
 VERSE_LINES = [
     "We ride through the night, chasing the glow",
@@ -30,16 +57,18 @@ BRIDGE_LINES = [
 ]
 
 
+@lru_cache(maxsize=1024)
 def generate_local_lyrics(title: str, artist: str) -> str:
     """Generate lyrics locally, ensuring a full output always."""
-    random.seed(title + artist)
+    # same sequence as seeding the global RNG, without touching it
+    rng = random.Random(title + artist)
 
     title = html.unescape(title)
     artist = html.unescape(artist)
 
-    verses = "\n".join(random.sample(VERSE_LINES, len(VERSE_LINES)))
-    chorus = "\n".join(line.format(title=title) for line in random.sample(CHORUS_LINES, 3))
-    bridge = "\n".join(random.sample(BRIDGE_LINES, 3))
+    verses = "\n".join(rng.sample(VERSE_LINES, len(VERSE_LINES)))
+    chorus = "\n".join(line.format(title=title) for line in rng.sample(CHORUS_LINES, 3))
+    bridge = "\n".join(rng.sample(BRIDGE_LINES, 3))
 
     return f"""{title} — {artist}
 
@@ -57,21 +86,47 @@ def generate_local_lyrics(title: str, artist: str) -> str:
 """
 
 
+def fetch_lyrics(title: str, artist: str):
+    """Ask lyrics.ovh; returns ``(lyrics or None, ttl)``. Blocking."""
+    try:
+        with timed("lyrics_api"):
+            r = session.get(f"{LYRICS_API}/{quote(artist, safe='')}/{quote(title, safe='')}", timeout=LYRICS_TIMEOUT)
+    except requests.RequestException:
+        return None, LYRICS_ERROR_TTL
+    if r.status_code == 200:
+        try:
+            lyrics = r.json().get("lyrics", "").strip()
+        except ValueError:
+            return None, LYRICS_ERROR_TTL
+        if lyrics and len(lyrics.splitlines()) > 3:
+            return lyrics, LYRICS_TTL
+        return None, LYRICS_MISS_TTL
+    if r.status_code == 404:
+        return None, LYRICS_MISS_TTL
+    return None, LYRICS_ERROR_TTL
+
+
+async def lookup_lyrics(key: str, title: str, artist: str):
+    lyrics, ttl = await run_in_threadpool(fetch_lyrics, title, artist)
+    # misses are cached too ({"lyrics": None}) so they return instantly next time
+    _lyrics_cache.set(key, {"lyrics": lyrics}, ttl=ttl)
+    return lyrics
+
+
 @router.get("/")
-def get_lyrics(title: str = Query(...), artist: str = Query(...)):
+async def get_lyrics(title: str = Query(...), artist: str = Query(...)):
     title = html.unescape(title)
     artist = html.unescape(artist)
 
-    # Try real lyrics API
-    try:
-        r = requests.get(f"https://api.lyrics.ovh/v1/{artist}/{title}", timeout=6)
-        if r.status_code == 200:
-            data = r.json()
-            lyrics = data.get("lyrics", "").strip()
-            if lyrics and len(lyrics.splitlines()) > 3:
-                return JSONResponse({"lyrics": lyrics, "source": "api"})
-    except Exception:
-        pass
+    # Try real lyrics API (cached by normalized artist/title, coalesced while in flight)
+    key = f"{normalize_query(artist)}\x1f{normalize_query(title)}"
+    cached = _lyrics_cache.get(key)
+    if cached is not None:
+        lyrics = cached["lyrics"]
+    else:
+        lyrics = await _lyrics_flight.run(key, lookup_lyrics, key, title, artist)
+    if lyrics:
+        return JSONResponse({"lyrics": lyrics, "source": "api"})
 
     # Always generate fallback
     generated = generate_local_lyrics(title, artist)
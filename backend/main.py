@@ -1,14 +1,35 @@
+import time
+_import_started = time.perf_counter()
+import asyncio
 import json
-import yt_dlp
+import os
 import random
-import time
 from fastapi import FastAPI, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pathlib import Path
 import logging
+import requests
+from utils.audio_cache import audio_cache, MEDIA_TYPES
+from utils.audio_proxy import open_upstream, iter_body, passthrough_headers, UpstreamExpired
+from utils.cache import TTLCache, make_cache, normalize_query, url_ttl, sweep_forever
+from utils.catalog import catalog
+from utils.dedupe import DuplicateIndex, dedupe
+from utils.history import history
+from utils.library import LibraryStore
+from utils import metrics
+from utils.metrics import MetricsMiddleware
+from utils.recommender import recommender
+from utils.static_files import StaticSite, etag_matches
+from utils.prefetch import Prefetcher, PREFETCH_COUNT, PREFETCH_REFRESH_AHEAD
+from utils.extractor import (
+    extract, pool, ydl_pool, upstream, PROFILES, ExtractorBusy, ExtractorTimeout, UpstreamUnavailable, SingleFlight,
+    compact_info, stream_url_of, video_id_from_url, watch_url,
+)
 
 app = FastAPI()
+IMPORT_SECONDS = time.perf_counter() - _import_started
 logger = logging.getLogger("nebula-backend")
 
 app.add_middleware(
@@ -18,196 +39,716 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+#  EXTRACTION POOL (yt-dlp runs off the event loop)
+
+@app.exception_handler(ExtractorBusy)
+async def extractor_busy(request: Request, exc: ExtractorBusy):
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "2"})
+
+@app.exception_handler(ExtractorTimeout)
+async def extractor_timeout(request: Request, exc: ExtractorTimeout):
+    return JSONResponse({"error": str(exc)}, status_code=504)
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable(request: Request, exc: UpstreamUnavailable):
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": str(int(exc.retry_after))})
+
+# Raised by extraction itself; callers fall back to last-known-good data on these.
+UPSTREAM_ERRORS = (ExtractorBusy, ExtractorTimeout, UpstreamUnavailable)
+
+@app.on_event("shutdown")
+def shutdown_extractor():
+    pool.shutdown()
+    ydl_pool.close()
+
+#  WARM-UP + HEALTH
+# uvicorn only accepts connections once the startup hooks return, so the slow
+# parts (importing yt_dlp and pre-building YoutubeDL instances, loading the
+# library and play history, indexing the audio cache and frontend, seeding
+# catalog/recommender) run in a background task; importing this module opens
+# no files. /healthz answers right away; /readyz turns 200 once warm-up is done.
+
+warmup = {"ready": False, "steps": {}, "failed": {}}
+_warmup_task = None
+_started_at = None
+
+def warmup_steps():
+    return [
+        ("frontend", frontend.build),
+        ("library", library.load),
+        ("audio_cache", audio_cache.load),
+        ("catalog", seed_catalog),
+        ("history", history.load),
+        # one instance per profile so the first request skips setup
+        ("extractor", ydl_pool.warm),
+    ]
+
+async def run_warmup():
+    loop = asyncio.get_running_loop()
+    for name, step in warmup_steps():
+        start = time.perf_counter()
+        try:
+            await loop.run_in_executor(None, step)
+        except Exception as e:
+            # a failed step only makes the first requests slower; do not stay unready forever
+            logger.warning(f"Warm-up step {name} failed: {e}")
+            warmup["failed"][name] = str(e)
+        warmup["steps"][name] = round(time.perf_counter() - start, 3)
+    warmup["warmup_seconds"] = round(time.perf_counter() - _started_at, 3)
+    warmup["ready"] = True
+    logger.info(f"Ready after {warmup['warmup_seconds']}s warm-up: {warmup['steps']}")
+
+@app.on_event("startup")
+async def start_warmup():
+    global _warmup_task, _started_at
+    _started_at = time.perf_counter()
+    _warmup_task = asyncio.create_task(run_warmup())
+
+@app.on_event("shutdown")
+async def stop_warmup():
+    if _warmup_task:
+        _warmup_task.cancel()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and the event loop is responsive."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: warm-up has finished, so requests get the fast path."""
+    body = {
+        "status": "ready" if warmup["ready"] else "warming",
+        "import_seconds": round(IMPORT_SECONDS, 3),
+        **{k: v for k, v in warmup.items() if k != "ready"},
+    }
+    return JSONResponse(body, status_code=200 if warmup["ready"] else 503)
+
 #  STREAM CACHING (major speed boost)
-_stream_cache = {}
-CACHE_TTL = 60 * 30  
+# Bounded LRU; each entry lives until its googlevideo URL's own expire= minus a margin.
+# Set NEBULA_SHARED_CACHE=data/cache.db to share entries across workers and restarts.
+CACHE_TTL = 60 * 30
+STREAM_CACHE_SIZE = int(os.getenv("NEBULA_STREAM_CACHE_SIZE", "2000"))
+STREAM_EXPIRY_MARGIN = 60 * 5
+_stream_cache = make_cache("stream", STREAM_CACHE_SIZE, CACHE_TTL)
+
+# LAST-KNOWN-GOOD RESULTS
+# Every successful metadata/search/upnext/stream result is also kept here for a
+# day. When extraction fails (breaker open, timeout, rate limit) endpoints serve
+# it instead, marked with "stale": true and an X-Stale header.
+LAST_GOOD_TTL = 60 * 60 * 24
+LAST_GOOD_SIZE = int(os.getenv("NEBULA_LAST_GOOD_SIZE", "10000"))
+_last_good = make_cache("last_good", LAST_GOOD_SIZE, LAST_GOOD_TTL)
+
+def stale_response(body, status_code: int = 200):
+    if isinstance(body, dict):
+        body = dict(body, stale=True)
+    return JSONResponse(body, status_code=status_code, headers={"X-Stale": "1"})
 
 def get_cached_stream(url: str):
-    now = time.time()
-    entry = _stream_cache.get(url)
-    if entry and now - entry["time"] < CACHE_TTL:
-        return entry["url"]
-    elif entry:
-        _stream_cache.pop(url, None)
-    return None
+    return _stream_cache.get(url)
 
 def save_stream(url: str, stream_url: str):
-    _stream_cache[url] = {"url": stream_url, "time": time.time()}
+    _stream_cache.set(url, stream_url, ttl=url_ttl(stream_url, CACHE_TTL, STREAM_EXPIRY_MARGIN))
+    # usable until the signed URL itself expires
+    _last_good.set(f"stream:{url}", stream_url, ttl=url_ttl(stream_url, CACHE_TTL, 0))
+
+_sweeper = None
+
+@app.on_event("startup")
+async def start_cache_sweeper():
+    global _sweeper
+    _sweeper = asyncio.create_task(sweep_forever(
+        [_stream_cache, _search_cache, _meta_cache, _upnext_cache, _last_good, _playlist_index]
+    ))
+
+@app.on_event("shutdown")
+async def stop_cache_sweeper():
+    if _sweeper:
+        _sweeper.cancel()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "stream": _stream_cache.stats(),
+        "search": _search_cache.stats(),
+        "metadata": _meta_cache.stats(),
+        "upnext": _upnext_cache.stats(),
+        "audio": audio_cache.stats(),
+        "last_good": _last_good.stats(),
+        "playlist_index": _playlist_index.stats(),
+        "upstream": upstream.stats(),
+    }
+
+# METRICS
+# Prometheus text format. Request/stage histograms live in utils/metrics.py;
+# cache counters and queue depths are read from their owners at scrape time.
+
+CACHE_COUNTERS = (
+    ("hits", "Cache lookups answered from the cache."),
+    ("misses", "Cache lookups that found nothing."),
+    ("evictions", "Entries dropped to stay within the size limit."),
+    ("expirations", "Entries dropped because their TTL ran out."),
+)
+
+@metrics.collector
+def app_metrics():
+    caches = [_stream_cache, _search_cache, _meta_cache, _upnext_cache, _last_good]
+    stats = {cache.name: cache.stats() for cache in caches}
+    stats["audio"] = audio_cache.stats()
+    families = [
+        (f"nebula_cache_{key}_total", "counter", help,
+         [({"cache": name}, s[key]) for name, s in stats.items() if key in s])
+        for key, help in CACHE_COUNTERS
+    ]
+    families += [
+        ("nebula_cache_entries", "gauge", "Entries held in the in-process cache.",
+         [({"cache": cache.name}, len(cache)) for cache in caches]),
+        ("nebula_audio_cache_bytes", "gauge", "Bytes held in the on-disk audio cache.",
+         [({}, stats["audio"]["bytes"])]),
+        ("nebula_extract_pending", "gauge", "Extraction jobs running or waiting for a worker.",
+         [({}, pool.pending)]),
+        ("nebula_extract_workers", "gauge", "Extraction worker threads.",
+         [({}, pool.workers)]),
+        ("nebula_ydl_idle", "gauge", "Idle pooled YoutubeDL instances per option profile.",
+         [({"profile": name}, n) for name, n in ydl_pool.stats()["idle"].items()]),
+        ("nebula_prefetch_queue", "gauge", "Up Next tracks waiting to be prefetched.",
+         [({}, prefetcher.queue_depth)]),
+        ("nebula_upstream_breaker_open", "gauge", "1 while the YouTube circuit breaker is open.",
+         [({}, int(upstream.breaker.state == "open"))]),
+        ("nebula_upstream_breaker_trips_total", "counter", "Times the YouTube circuit breaker has opened.",
+         [({}, upstream.breaker.opened)]),
+        ("nebula_upstream_rate_limited_total", "counter", "Extractions refused by the YouTube rate limiter.",
+         [({}, upstream.rate_limited)]),
+        ("nebula_upstream_timeout_seconds", "gauge", "Current adaptive extraction timeout.",
+         [({}, round(upstream.timeout.current(), 3))]),
+        ("nebula_plays_total", "counter", "Plays recorded in the play history.",
+         [({}, history.version)]),
+        ("nebula_ready", "gauge", "1 once warm-up has finished.",
+         [({}, int(warmup["ready"]))]),
+        ("nebula_startup_seconds", "gauge", "Time spent importing the app and in each warm-up step.",
+         [({"phase": "import"}, round(IMPORT_SECONDS, 3))]
+         + [({"phase": name}, secs) for name, secs in warmup["steps"].items()]),
+    ]
+    return families
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# TRACK METADATA
+# One full extraction per video, kept in compact form (utils/extractor.compact_info)
+# and shared by /stream, /track_info and /autoplay/upnext.
+
+META_TTL = 60 * 60 * 6
+META_CACHE_SIZE = int(os.getenv("NEBULA_META_CACHE_SIZE", "5000"))
+_meta_cache = make_cache("metadata", META_CACHE_SIZE, META_TTL)
+_meta_flight = SingleFlight()
+
+async def fetch_metadata(video_id: str):
+    info = await extract(watch_url(video_id), "stream")
+    meta = compact_info(info, video_id)
+    _meta_cache.set(video_id, meta)
+    _last_good.set(f"meta:{video_id}", meta)
+    catalog.upsert([{
+        "videoId": video_id,
+        "title": meta["title"],
+        "artist": meta["uploader"],
+        "thumbnail": meta["thumbnail"],
+        "duration": meta["duration"],
+    }])
+    return meta
+
+async def get_metadata(video_id: str, refresh: bool = False):
+    if not refresh:
+        meta = _meta_cache.get(video_id)
+        if meta:
+            return meta
+    try:
+        return await _meta_flight.run(video_id, fetch_metadata, video_id)
+    except Exception:
+        stale = _last_good.get(f"meta:{video_id}")
+        if stale is None:
+            raise
+        return dict(stale, stale=True)
+
+def usable_url(meta: dict, margin: float = STREAM_EXPIRY_MARGIN):
+    """The metadata's stream URL if it has more than ``margin`` seconds left, else None."""
+    url = meta.get("url")
+    return url if url and url_ttl(url, CACHE_TTL, margin) > 0 else None
 
 # STREAM ENDPOINT
 
+_stream_flight = SingleFlight()
+
+async def resolve_stream(url: str):
+    # only for inputs that are not a recognisable YouTube video
+    info = await extract(url, "stream")
+    return stream_url_of(info)
+
+async def get_stream_url(url: str, refresh: bool = False):
+    """Cached + coalesced stream URL lookup -> ``(stream URL or None, stale)``.
+
+    ``refresh`` forces a new extraction. ``stale`` means YouTube failed and the
+    URL comes from the last-known-good metadata; it is not cached again.
+    """
+    # watch?v=, youtu.be and bare IDs all share one cache entry and one extraction
+    video_id = video_id_from_url(url)
+    key = video_id or url
+    if refresh:
+        _stream_cache.pop(key)
+    cached = get_cached_stream(key)
+    if cached:
+        return cached, False
+    if not video_id:
+        stream_url = await _stream_flight.run(key, resolve_stream, url)
+    else:
+        meta = await get_metadata(video_id, refresh=refresh)
+        if not usable_url(meta) and not refresh and not meta.get("stale"):
+            meta = await get_metadata(video_id, refresh=True)
+        stream_url = usable_url(meta)
+        if meta.get("stale"):
+            return stream_url, True
+    if stream_url:
+        save_stream(key, stream_url)
+    return stream_url, False
+
 @app.get("/stream")
 async def stream(url: str):
-    cached = get_cached_stream(url)
-    if cached:
-        return {"url": cached}
     try:
-        ydl_opts = {
-            "quiet": True,
-            "format": "bestaudio[ext=m4a]/bestaudio/best",
-            "extract_flat": False,
-            "noplaylist": True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            stream_url = (
-                info.get("url")
-                or next((f.get("url") for f in info.get("formats", []) if f.get("url")), None)
-            )
-            if stream_url:
-                save_stream(url, stream_url)
-                return {"url": stream_url}
-        return {"error": "Stream not found"}
+        stream_url, stale = await get_stream_url(url)
+        if stale and not stream_url:
+            raise UpstreamUnavailable("YouTube is failing", upstream.breaker.retry_after())
+    except UPSTREAM_ERRORS:
+        # an unexpired last-known-good URL still plays
+        stream_url, stale = _last_good.get(f"stream:{video_id_from_url(url) or url}"), True
+        if not stream_url:
+            raise
     except Exception as e:
         logger.warning(f"Stream failed: {e}")
         return {"error": str(e)}
+    if not stream_url:
+        return {"error": "Stream not found"}
+    record_play(video_id_from_url(url))
+    if stale:
+        return stale_response({"url": stream_url})
+    return {"url": stream_url}
+
+# UP NEXT PREFETCH
+# The first PREFETCH_COUNT Up Next tracks are resolved in the background (only
+# while an extraction worker is spare) and kept fresh while the listener is active.
+
+async def prefetch_track(video_id: str):
+    meta = await get_metadata(video_id)
+    if not usable_url(meta, PREFETCH_REFRESH_AHEAD) and not meta.get("stale"):
+        meta = await get_metadata(video_id, refresh=True)
+    if usable_url(meta) and not meta.get("stale"):
+        save_stream(video_id, meta["url"])
+
+prefetcher = Prefetcher(prefetch_track, _stream_cache.remaining)
+
+@app.on_event("startup")
+async def start_prefetcher():
+    prefetcher.start()
+
+@app.on_event("shutdown")
+async def stop_prefetcher():
+    prefetcher.stop()
+
+# AUDIO PROXY
+# Streams the audio through the backend so playback starts on the first chunk,
+# Range/seek requests pass straight through, and an expired or IP-bound signed
+# URL is re-resolved transparently.
+
+# Hot tracks are copied to the on-disk audio cache and served from there
+# (FileResponse handles Range and uses zero-copy sends where the server supports it).
+AUDIO_FORMAT = PROFILES["stream"]["format"]
+_audio_fill_flight = SingleFlight()
+
+def store_upstream(video_id: str, stream_url: str):
+    upstream = open_upstream(stream_url)
+    if upstream.status_code != 200:
+        upstream.close()
+        return
+    audio_cache.put(video_id, AUDIO_FORMAT, iter_body(upstream), upstream.headers.get("content-type"))
+
+async def fill_audio_cache(video_id: str):
+    try:
+        stream_url, _ = await get_stream_url(video_id)
+        if stream_url:
+            await run_in_threadpool(store_upstream, video_id, stream_url)
+    except Exception as e:
+        logger.warning(f"Audio cache fill failed for {video_id}: {e}")
+
+@app.get("/stream/audio/{videoId}")
+async def stream_audio(videoId: str, request: Request):
+    range_header = request.headers.get("range")
+    # only the first request of a play counts towards caching the track, not every Range after it
+    play_start = not range_header or range_header.replace(" ", "").startswith("bytes=0-")
+    client = request.client.host if request.client else None
+    cached = audio_cache.get(videoId, AUDIO_FORMAT, play_start, client)
+    if cached:
+        return FileResponse(cached, media_type=MEDIA_TYPES.get(cached.suffix.lstrip("."), "application/octet-stream"))
+    if audio_cache.is_hot(videoId, AUDIO_FORMAT):
+        _audio_fill_flight.start(videoId, fill_audio_cache, videoId)
+
+    for attempt in range(2):
+        try:
+            stream_url, _ = await get_stream_url(videoId, refresh=attempt > 0)
+        except UPSTREAM_ERRORS:
+            # an unexpired last-known-good URL still plays
+            stream_url = attempt == 0 and _last_good.get(f"stream:{videoId}")
+            if not stream_url:
+                raise
+        except Exception as e:
+            logger.warning(f"Audio proxy resolve failed: {e}")
+            return JSONResponse({"error": str(e)}, status_code=502)
+        if not stream_url:
+            return JSONResponse({"error": "Stream not found"}, status_code=404)
+        try:
+            resp = await run_in_threadpool(open_upstream, stream_url, range_header)
+        except UpstreamExpired:
+            continue
+        except requests.RequestException as e:
+            logger.warning(f"Audio proxy upstream failed: {e}")
+            return JSONResponse({"error": str(e)}, status_code=502)
+        return StreamingResponse(
+            iter_body(resp),
+            status_code=resp.status_code,
+            headers=passthrough_headers(resp),
+        )
+    return JSONResponse({"error": "Upstream refused a freshly resolved URL"}, status_code=502)
 
 # SEARCH ENDPOINT
+# Results are fresh for SEARCH_FRESH; for SEARCH_STALE after that they are
+# still served instantly while one background refresh replaces them.
+
+SEARCH_FRESH = 60 * 10
+SEARCH_STALE = 60 * 60
+SEARCH_CACHE_SIZE = int(os.getenv("NEBULA_SEARCH_CACHE_SIZE", "1000"))
+_search_cache = make_cache("search", SEARCH_CACHE_SIZE, SEARCH_FRESH + SEARCH_STALE)
+_search_flight = SingleFlight()
+
+async def run_search(key: str, q: str):
+    info = await extract(f"ytsearch20:{q}", "flat")
+    results = [
+        {
+            "videoId": e.get("id"),
+            "title": e.get("title"),
+            "artist": e.get("uploader"),
+            "thumbnail": f"https://img.youtube.com/vi/{e.get('id')}/hqdefault.jpg",
+        }
+        for e in info.get("entries", [])
+        if e.get("id")
+    ]
+    results = dedupe(results)
+    _search_cache.set(key, {"results": results, "fresh_until": time.time() + SEARCH_FRESH})
+    _last_good.set(f"search:{key}", results)
+    catalog.upsert(results)
+    return results
+
+async def refresh_search(key: str, q: str):
+    try:
+        return await run_search(key, q)
+    except Exception as e:
+        logger.warning(f"/search background refresh failed: {e}")
+
+# source=youtube (default) always uses yt-dlp results; source=local answers only from the
+# local catalog; source=hybrid answers from the catalog and falls back to yt-dlp on a miss.
+HYBRID_MIN_RESULTS = 5
 
 @app.get("/search")
-async def search(q: str):
+async def search(q: str, source: str = Query("youtube", pattern="^(youtube|local|hybrid)$")):
+    if source != "youtube":
+        local = dedupe(catalog.search(q))
+        if source == "local" or len(local) >= HYBRID_MIN_RESULTS:
+            return local
+    key = normalize_query(q)
+    entry = _search_cache.get(key)
+    if entry:
+        if entry["fresh_until"] < time.time():
+            _search_flight.start(key, refresh_search, key, q)
+        return entry["results"]
     try:
-        ydl_opts = {"quiet": True, "extract_flat": True, "skip_download": True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch20:{q}", download=False)
-        results = [
-            {
-                "videoId": e.get("id"),
-                "title": e.get("title"),
-                "artist": e.get("uploader"),
-                "thumbnail": f"https://img.youtube.com/vi/{e.get('id')}/hqdefault.jpg",
-            }
-            for e in info.get("entries", [])
-            if e.get("id")
-        ]
-        return results
+        return await _search_flight.run(key, run_search, key, q)
+    except UPSTREAM_ERRORS:
+        stale = _last_good.get(f"search:{key}")
+        if stale is not None:
+            return stale_response(stale)
+        raise
     except Exception as e:
         logger.warning(f"/search failed: {e}")
         return []
 
 
 # SMART UP NEXT (Dynamic Autoplay)
+# Served from the local co-occurrence recommender (playlists, likes, play order)
+# when it knows enough about the track; YouTube's related videos only fill the gap.
+# The remote candidate list per video is cached for UPNEXT_TTL and reshuffled per call.
+
+UPNEXT_SIZE = 20
+UPNEXT_LOCAL_MIN = 10
+
+UPNEXT_TTL = 60 * 10
+_upnext_cache = make_cache("upnext", 2000, UPNEXT_TTL)
+
+async def build_upnext(videoId: str):
+    """YouTube's related videos for ``videoId`` -> ``(tracks, stale)``; stale lists are not cached."""
+    meta = await get_metadata(videoId)
+
+    # the seed itself and its re-uploads ("(Official Audio)", "[Lyrics]", ...) never come next
+    seen = DuplicateIndex()
+    seen.add([{"videoId": videoId, "title": meta["title"], "artist": meta["uploader"]}])
+    related = seen.filter(
+        {
+            "videoId": e["id"],
+            "title": e.get("title") or "Unknown Title",
+            "artist": e.get("uploader") or "Unknown Artist",
+            "thumbnail": f"https://img.youtube.com/vi/{e['id']}/hqdefault.jpg",
+        }
+        for e in meta["related"][:25]
+        if e.get("id")
+    )
+
+    if len(related) < 10:
+        keywords = []
+        base_title = (meta["title"] or "").lower()
+        uploader = (meta["uploader"] or "").lower()
+        if "slowed" in base_title:
+            keywords += ["slowed reverb", "chill", "dreamcore", "reverb mix"]
+        elif "mix" in base_title:
+            keywords += ["mix songs", "playlist", "dj set"]
+        elif "lofi" in base_title:
+            keywords += ["lofi beats", "chillhop", "study music"]
+        else:
+            keywords += ["official audio", "remix", "cover", "song"]
+
+        query = f"{uploader} {base_title.split('-')[0]} {' '.join(keywords)}"
+        search_info = await extract(f"ytsearch15:{query}", "flat")
+
+        related += seen.filter(
+            {
+                "videoId": e["id"],
+                "title": e.get("title"),
+                "artist": e.get("uploader"),
+                "thumbnail": f"https://img.youtube.com/vi/{e['id']}/hqdefault.jpg",
+            }
+            for e in search_info.get("entries", [])
+            if e.get("id")
+        )
 
-_upnext_cache = {}
-UPNEXT_TTL = 60 * 10  
+    catalog.upsert(related)
+    if meta.get("stale"):
+        return related, True
+    _upnext_cache.set(videoId, related)
+    _last_good.set(f"upnext:{videoId}", related)
+    return related, False
 
 @app.get("/autoplay/upnext")
 async def autoplay_upnext(videoId: str):
     """Smart Up Next Generator — produces mix-like related songs."""
     try:
-        ydl_opts = {"quiet": True, "extract_flat": True, "skip_download": True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"https://www.youtube.com/watch?v={videoId}", download=False)
-
-        related = []
-        added_ids = set()
-        added_titles = set()
-        
-        for e in info.get("related_videos", [])[:25]:
-            vid = e.get("id")
-            title = (e.get("title") or "").strip().lower()
-            if not vid or vid in added_ids or title in added_titles:
-                continue
-            related.append({
-                "videoId": vid,
-                "title": e.get("title") or "Unknown Title",
-                "artist": e.get("uploader") or "Unknown Artist",
-                "thumbnail": f"https://img.youtube.com/vi/{vid}/hqdefault.jpg",
-            })
-            added_ids.add(vid)
-            added_titles.add(title)
-
-        if len(related) < 10:
-            keywords = []
-            base_title = (info.get("title") or "").lower()
-            uploader = (info.get("uploader") or "").lower()
-            if "slowed" in base_title:
-                keywords += ["slowed reverb", "chill", "dreamcore", "reverb mix"]
-            elif "mix" in base_title:
-                keywords += ["mix songs", "playlist", "dj set"]
-            elif "lofi" in base_title:
-                keywords += ["lofi beats", "chillhop", "study music"]
-            else:
-                keywords += ["official audio", "remix", "cover", "song"]
-
-            query = f"{uploader} {base_title.split('-')[0]} {' '.join(keywords)}"
-            search_info = ydl.extract_info(f"ytsearch15:{query}", download=False)
-
-            for e in search_info.get("entries", []):
-                vid = e.get("id")
-                title = (e.get("title") or "").strip().lower()
-                if not vid or vid in added_ids or title in added_titles:
-                    continue
-                related.append({
-                    "videoId": vid,
-                    "title": e.get("title"),
-                    "artist": e.get("uploader"),
-                    "thumbnail": f"https://img.youtube.com/vi/{vid}/hqdefault.jpg",
-                })
-                added_ids.add(vid)
-                added_titles.add(title)
-
-        random.shuffle(related)
-        related = related[:20]
-
+        meta = _meta_cache.get(videoId)
+        seed = meta and {
+            "videoId": videoId, "title": meta["title"], "artist": meta["uploader"], "thumbnail": meta["thumbnail"],
+        }
+        # one index for the whole list: the seed's other uploads and repeats of the same song go
+        seen = DuplicateIndex()
+        seen.add([seed or {"videoId": videoId}])
+        related = seen.filter(recommender.recommend(videoId, UPNEXT_SIZE))
+
+        stale = False
+        if len(related) < UPNEXT_LOCAL_MIN:
+            remote = _upnext_cache.get(videoId)
+            if remote is None:
+                try:
+                    remote, stale = await build_upnext(videoId)
+                except UPSTREAM_ERRORS:
+                    remote = _last_good.get(f"upnext:{videoId}")
+                    if remote is None:
+                        if related:
+                            # the local recommendations alone are better than an error
+                            remote, stale = [], True
+                        else:
+                            raise
+                    else:
+                        stale = True
+            remote = seen.filter(remote)
+            random.shuffle(remote)
+            related = related + remote
+        related = related[:UPNEXT_SIZE]
+        prefetcher.enqueue([r["videoId"] for r in related[:PREFETCH_COUNT]])
+
+        if stale:
+            return stale_response({"upnext": related})
         return {"upnext": related}
 
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.warning(f"UpNext failed: {e}")
         return {"upnext": []}
 
 # TRACK INFO ENDPOINT
 
+def track_info_of(video_id: str, meta: dict = None):
+    meta = meta or {}
+    info = {
+        "videoId": video_id,
+        "title": meta.get("title") or "Unknown Title",
+        "artist": meta.get("uploader") or "Unknown Artist",
+        "duration": meta.get("duration") or 0,
+        "thumbnail": meta.get("thumbnail") or f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",
+    }
+    if meta.get("stale"):
+        info["stale"] = True
+    return info
+
 @app.get("/track_info")
 async def get_track_info(video_id: str):
     """Get detailed info about a single YouTube track."""
     try:
-        ydl_opts = {
-            "quiet": True,
-            "extract_flat": False,
-            "skip_download": True,
-            "noplaylist": True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-
-        return {
-            "videoId": video_id,
-            "title": info.get("title", "Unknown Title"),
-            "artist": info.get("uploader", "Unknown Artist"),
-            "duration": info.get("duration", 0),
-            "thumbnail": info.get("thumbnail", f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"),
-        }
+        info = track_info_of(video_id, await get_metadata(video_id))
+        return stale_response(info) if info.get("stale") else info
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.warning(f"Track info failed: {e}")
-        return {
-            "videoId": video_id,
-            "title": "Unknown Title",
-            "artist": "Unknown Artist",
-            "duration": 0,
-            "thumbnail": f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",
-        }
-        
+        return track_info_of(video_id)
+
+# BATCH ENDPOINTS
+# One round trip for a whole page of tracks. Cache hits are answered inline;
+# misses fan out with at most BATCH_CONCURRENCY extractions at a time, so a
+# large batch cannot fill the extraction queue on its own.
+
+BATCH_MAX = int(os.getenv("NEBULA_BATCH_MAX", "100"))
+BATCH_CONCURRENCY = int(os.getenv("NEBULA_BATCH_CONCURRENCY", str(pool.background_limit)))
+
+async def batch_ids(request: Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, JSONResponse({"error": "Body must be JSON"}, status_code=400)
+    ids = body.get("videoIds") if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, str) and i for i in ids):
+        return None, JSONResponse({"error": "videoIds must be a list of strings"}, status_code=400)
+    if len(ids) > BATCH_MAX:
+        return None, JSONResponse({"error": f"At most {BATCH_MAX} videoIds per batch"}, status_code=400)
+    return list(dict.fromkeys(ids)), None
+
+async def run_batch(ids, cached, resolve):
+    """``cached(id)`` answers without extracting (or returns None); ``resolve(id)``
+    does the slow path. Returns ``{id: result}`` with ``{"error": ...}`` per failed item;
+    anything but a bare video ID fails without reaching either."""
+    results = {}
+    misses = []
+    for video_id in ids:
+        if video_id_from_url(video_id) != video_id:
+            results[video_id] = {"error": "Invalid videoId"}
+            continue
+        hit = cached(video_id)
+        if hit is not None:
+            results[video_id] = hit
+        else:
+            misses.append(video_id)
+
+    gate = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+    async def one(video_id: str):
+        async with gate:
+            try:
+                results[video_id] = await resolve(video_id)
+            except ExtractorBusy:
+                results[video_id] = {"error": "busy"}
+            except ExtractorTimeout:
+                results[video_id] = {"error": "timeout"}
+            except UpstreamUnavailable:
+                results[video_id] = {"error": "upstream unavailable"}
+            except Exception as e:
+                logger.warning(f"Batch item {video_id} failed: {e}")
+                results[video_id] = {"error": str(e)}
+
+    await asyncio.gather(*(one(video_id) for video_id in misses))
+    return results
+
+@app.post("/track_info/batch")
+async def track_info_batch(request: Request):
+    """Body: {"videoIds": [...]} -> {"items": [track_info | {"videoId", "error"}]}"""
+    ids, error = await batch_ids(request)
+    if error:
+        return error
+
+    def cached(video_id):
+        meta = _meta_cache.get(video_id)
+        return track_info_of(video_id, meta) if meta else None
+
+    async def resolve(video_id):
+        return track_info_of(video_id, await get_metadata(video_id))
+
+    results = await run_batch(ids, cached, resolve)
+    return {"items": [
+        {"videoId": i, **results[i]} if "error" in results[i] else results[i]
+        for i in ids
+    ]}
+
+@app.post("/stream/batch")
+async def stream_batch(request: Request):
+    """Body: {"videoIds": [...]} -> {"items": [{"videoId", "url"} | {"videoId", "error"}]}"""
+    ids, error = await batch_ids(request)
+    if error:
+        return error
+
+    def cached(video_id):
+        url = get_cached_stream(video_id)
+        if not url:
+            meta = _meta_cache.get(video_id)
+            url = meta and usable_url(meta)
+        return {"url": url} if url else None
+
+    async def resolve(video_id):
+        url, stale = await get_stream_url(video_id)
+        if not url:
+            return {"error": "Stream not found"}
+        return {"url": url, "stale": True} if stale else {"url": url}
+
+    results = await run_batch(ids, cached, resolve)
+    return {"items": [{"videoId": i, **results[i]} for i in ids]}
+
 #  PLAYLIST MANAGEMENT
+# Playlists and likes live in memory (utils/library.py); mutations go to an
+# append-only journal that is periodically compacted back into the JSON files
+# (in a background thread). Workers sharing the files lock them and pick up each
+# other's journal lines before every read or write. Reads carry a per-section ETag (304 when unchanged), and /library/changes
+# returns just what changed since a version the client already has.
 
 PLAYLISTS_FILE = Path("playlists.json")
+LIKES_FILE = Path("liked_songs.json")
+LIBRARY_JOURNAL = Path("library.journal")
 
-def load_playlists():
-    if PLAYLISTS_FILE.exists():
-        try:
-            with open(PLAYLISTS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f).get("playlists", [])
-        except:
-            return []
-    return []
+library = LibraryStore(PLAYLISTS_FILE, LIKES_FILE, LIBRARY_JOURNAL)  # loaded during warm-up
+
+@app.on_event("shutdown")
+def close_library():
+    library.close()
+    history.close()
 
-def save_playlists(playlists):
-    with open(PLAYLISTS_FILE, "w", encoding="utf-8") as f:
-        json.dump({"playlists": playlists}, f, indent=2)
+_library_bodies = {}  # section -> (etag, rendered JSON)
+
+def library_response(request: Request, section: str, build):
+    etag = library.etag(section)
+    headers = {"etag": etag, "cache-control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    cached = _library_bodies.get(section)
+    if cached is None or cached[0] != etag:
+        cached = _library_bodies[section] = (etag, json.dumps({section: build()}).encode())
+    return Response(cached[1], media_type="application/json", headers=headers)
 
 @app.get("/playlist/all")
-async def get_all_playlists():
-    return {"playlists": load_playlists()}
+async def get_all_playlists(request: Request):
+    return library_response(request, "playlists", library.all_playlists)
 
 @app.post("/playlist/create")
 async def create_playlist(request: Request):
@@ -215,56 +756,65 @@ async def create_playlist(request: Request):
     name = body.get("name", "").strip()
     if not name:
         return {"error": "Playlist name required"}
-    playlists = load_playlists()
-    new_id = max([p["id"] for p in playlists], default=0) + 1 if playlists else 1
-    new_playlist = {"id": new_id, "name": name, "songs": []}
-    playlists.append(new_playlist)
-    save_playlists(playlists)
-    return {"id": new_id, "playlist": new_playlist}
+    new_playlist = library.create_playlist(name)
+    return {"id": new_playlist["id"], "playlist": new_playlist}
+
+# playlist id -> (playlists ETag it was built at, DuplicateIndex); per process, indexes are not JSON
+PLAYLIST_INDEX_SIZE = 256
+PLAYLIST_INDEX_TTL = 60 * 30
+_playlist_index = TTLCache(PLAYLIST_INDEX_SIZE, PLAYLIST_INDEX_TTL, name="playlist_index")
+
+def playlist_index(pid, songs):
+    """Near-duplicate index of a playlist's songs, rebuilt only after the library changed."""
+    etag = library.etag("playlists")
+    cached = _playlist_index.get(pid)
+    if cached is None or cached[0] != etag:
+        index = DuplicateIndex()
+        index.add(songs)
+        cached = (etag, index)
+        _playlist_index.set(pid, cached)
+    return cached[1]
 
 @app.post("/playlist/add")
 async def add_to_playlist(request: Request):
     body = await request.json()
     pid, videoId = body.get("playlist_id"), body.get("videoId")
-    playlists = load_playlists()
-    for pl in playlists:
-        if pl["id"] == pid:
-            if any(s["videoId"] == videoId for s in pl["songs"]):
-                return {"message": "Already added"}
-            pl["songs"].append({
-                "videoId": videoId,
-                "title": body.get("title"),
-                "artist": body.get("artist"),
-                "thumbnail": body.get("thumbnail"),
-            })
-            save_playlists(playlists)
-            return {"message": "Song added"}
-    return {"error": "Playlist not found"}
+    song = {
+        "videoId": videoId,
+        "title": body.get("title"),
+        "artist": body.get("artist"),
+        "thumbnail": body.get("thumbnail"),
+    }
+    existing = library.playlist_songs(pid)
+    # an empty (or unknown) playlist has nothing to duplicate and gets no index
+    index = playlist_index(pid, existing) if existing else None
+    duplicate = index and index.find(song)
+    if duplicate and duplicate["videoId"] != videoId and not body.get("force"):
+        # another upload of the same song; "force": true adds it anyway
+        return {"message": "Already added", "duplicateOf": duplicate["videoId"]}
+    added = library.add_song(pid, song)
+    if added is None:
+        return {"error": "Playlist not found"}
+    if not added:
+        return {"message": "Already added"}
+    if index is not None:
+        index.add([song])
+        _playlist_index.set(pid, (library.etag("playlists"), index))
+    catalog.upsert([song])
+    recommender.observe_playlist_add(existing, song)
+    return {"message": "Song added"}
 
 @app.delete("/playlist/delete")
 async def delete_playlist(playlist_id: int = Query(...)):
-    playlists = load_playlists()
-    updated = [p for p in playlists if p["id"] != playlist_id]
-    save_playlists(updated)
+    songs = library.playlist_songs(playlist_id)
+    library.delete_playlist(playlist_id)
+    if songs:
+        recommender.forget_playlist(songs)
+    _playlist_index.pop(playlist_id)
     return {"message": "Deleted"}
 
 #  LIKE / UNLIKE 
 
-LIKES_FILE = Path("liked_songs.json")
-
-def load_likes():
-    if LIKES_FILE.exists():
-        try:
-            with open(LIKES_FILE, "r", encoding="utf-8") as f:
-                return json.load(f).get("liked", [])
-        except:
-            return []
-    return []
-
-def save_likes(liked):
-    with open(LIKES_FILE, "w", encoding="utf-8") as f:
-        json.dump({"liked": liked}, f, indent=2)
-
 @app.post("/like")
 async def toggle_like(
     videoId: str = Query(...),
@@ -272,31 +822,148 @@ async def toggle_like(
     artist: str = Query(""),
     thumbnail: str = Query(""),
 ):
-    liked = load_likes()
-    exists = next((s for s in liked if s["videoId"] == videoId), None)
-    if exists:
-        liked = [s for s in liked if s["videoId"] != videoId]
-        save_likes(liked)
-        return {"liked": False, "message": "Song unliked"}
-    liked.append({
+    song = {
         "videoId": videoId,
         "title": title,
         "artist": artist,
         "thumbnail": thumbnail,
-    })
-    save_likes(liked)
+    }
+    if not library.toggle_like(song):
+        recommender.forget_like(videoId)
+        return {"liked": False, "message": "Song unliked"}
+    catalog.upsert([song])
+    recommender.observe_like(song)
     return {"liked": True, "message": "Song liked"}
 
 @app.get("/liked/all")
-async def get_all_liked():
-    return {"liked": load_likes()}
+async def get_all_liked(request: Request):
+    return library_response(request, "liked", library.all_likes)
+
+@app.get("/library/changes")
+async def library_changes(since: int = Query(0, ge=0), epoch: str = Query(None)):
+    """Delta sync: playlists upserted/deleted and likes added/removed after ``since``.
+
+    Send back the returned ``version`` (and ``epoch``) next time; ``"full": true``
+    means the delta was not available and the complete library is included.
+    """
+    return library.changes(since, epoch)
+
+#  PLAY HISTORY
+# Every resolved /stream (or an explicit POST /play) is appended to the play log
+# (utils/history.py); /recent, /toptracks and /madeforyou read aggregates that
+# are kept up to date as plays come in, never a scan of the log. The same plays,
+# in order, teach the recommender which tracks follow each other.
+
+MIX_ARTISTS = 3  # artist mixes on /madeforyou
+MIX_SIZE = 25
+MIX_REFRESH = 60  # seconds; /madeforyou is rebuilt at most this often
+_mixes = {"version": -1, "at": 0.0, "mixes": []}
+
+def observe_play(event: dict):
+    # live plays, and the whole log while it is replayed during warm-up
+    recommender.observe_play(event["videoId"], event, event["t"])
+
+history.listeners.append(observe_play)
+
+def record_play(video_id: str, track: dict = None):
+    if not video_id:
+        return
+    if track is None:
+        meta = _meta_cache.get(video_id) or _last_good.get(f"meta:{video_id}")
+        track = track_info_of(video_id, meta) if meta else {"videoId": video_id}
+    history.record(track)
+
+@app.post("/play")
+async def log_play(request: Request):
+    """Report a play the backend did not see (e.g. audio served from the browser's cache)."""
+    body = await request.json()
+    video_id = video_id_from_url(body.get("videoId") or "")
+    if not video_id:
+        return JSONResponse({"error": "videoId required"}, status_code=400)
+    track = {
+        "videoId": video_id,
+        "title": body.get("title"),
+        "artist": body.get("artist"),
+        "thumbnail": body.get("thumbnail"),
+    }
+    return {"recorded": history.record(track)}
+
+@app.get("/recent")
+async def recently_played(limit: int = Query(20, ge=1, le=200)):
+    return history.recent(limit)
+
+@app.get("/toptracks")
+async def top_tracks(
+    window: str = Query("week", pattern="^(day|week|all)$"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    tracks = history.top_tracks(window, limit)
+    if not tracks and window != "all":
+        # nothing played lately: all-time favourites beat an empty shelf
+        tracks = history.top_tracks("all", limit)
+    return tracks
+
+def build_mixes():
+    mixes = []
+    top = history.top_tracks("week", MIX_SIZE) or history.top_tracks("all", MIX_SIZE)
+    if top:
+        seen = {t["videoId"] for t in top}
+        picks = [t for t in recommender.recommend(top[0]["videoId"], MIX_SIZE) if t["videoId"] not in seen]
+        mixes.append({
+            "id": "on-repeat",
+            "name": "On Repeat",
+            "description": "The songs you keep coming back to",
+            "thumbnail": top[0]["thumbnail"],
+            "songs": top + picks[:max(0, MIX_SIZE - len(top))],
+        })
+    for artist in history.top_artists("all", MIX_ARTISTS):
+        songs = history.artist_tracks(artist["artist"], MIX_SIZE)
+        seen = {t["videoId"] for t in songs}
+        for t in recommender.recommend(songs[0]["videoId"], MIX_SIZE):
+            if len(songs) >= MIX_SIZE:
+                break
+            if t["videoId"] not in seen:
+                songs.append(t)
+                seen.add(t["videoId"])
+        mixes.append({
+            "id": f"artist-{len(mixes)}",
+            "name": f"{artist['artist']} Mix",
+            "description": f"{artist['artist']} and more like it",
+            "thumbnail": songs[0]["thumbnail"],
+            "songs": songs,
+        })
+    return mixes
+
+@app.get("/madeforyou")
+async def made_for_you():
+    now = time.time()
+    if _mixes["version"] != history.version and now - _mixes["at"] >= MIX_REFRESH:
+        _mixes.update(version=history.version, at=now, mixes=build_mixes())
+    return _mixes["mixes"]
+
+def seed_catalog():
+    # library songs are always searchable locally, even on a fresh catalog
+    playlists, liked = library.all_playlists(), library.all_likes()
+    catalog.upsert([s for pl in playlists for s in pl["songs"]])
+    catalog.upsert(liked)
+    recommender.build(playlists, liked)
 
 
 #  FRONTEND ( production build)
+# dist/ is indexed once at startup (utils/static_files.py): hashed bundles are
+# immutable, the rest revalidates by ETag, and .br/.gz variants are negotiated.
+
+FRONTEND_DIST = Path(os.getenv("NEBULA_FRONTEND_DIST", "frontend/dist"))
+frontend = StaticSite(FRONTEND_DIST)  # indexed during warm-up
 
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
-    index_path = Path("frontend/dist/index.html")
-    if index_path.exists():
-        return FileResponse(index_path)
-    return {"error": "Frontend build not found"}
+async def serve_frontend(full_path: str, request: Request):
+    entry = frontend.lookup(full_path)
+    if entry is None:
+        if frontend.is_asset_path(full_path):
+            return JSONResponse({"error": "Not found"}, status_code=404)
+        # client-side route: let the SPA handle it
+        entry = frontend.index_html
+    if entry is None:
+        return {"error": "Frontend build not found"}
+    return frontend.respond(entry, request.headers)
@@ -1,30 +1,60 @@
 from fastapi import APIRouter
-import yt_dlp, os
+from fastapi.responses import JSONResponse
+import os
+from utils.extractor import ydl_pool
+from utils.download_jobs import DownloadQueue, progress_hook, postprocessor_hook
 
 router = APIRouter(prefix="/api/download", tags=["download"])
 DOWNLOAD_PATH = "downloads"
 
-os.makedirs(DOWNLOAD_PATH, exist_ok=True)
+ydl_pool.register("download", {
+    "format": "bestaudio/best",
+    # the id keeps names unique when two videos share a title
+    "outtmpl": f"{DOWNLOAD_PATH}/%(title)s [%(id)s].%(ext)s",
+    "quiet": True,
+    "noplaylist": True,
+    "postprocessors": [{
+        "key": "FFmpegExtractAudio",
+        "preferredcodec": "mp3",
+        "preferredquality": "192"
+    }],
+    "progress_hooks": [progress_hook],
+    "postprocessor_hooks": [postprocessor_hook],
+})
+
+def download_audio(video_id: str):
+    """Blocking download + MP3 transcode; returns (title, final file path)."""
+    os.makedirs(DOWNLOAD_PATH, exist_ok=True)
+    with ydl_pool.checkout("download") as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+    # yt-dlp records the post-processed path, no need to guess the extension
+    filepath = info["requested_downloads"][-1]["filepath"]
+    return info["title"], filepath
+
+jobs = DownloadQueue(download_audio, os.path.join(DOWNLOAD_PATH, "index.json"))
+
+@router.post("/{video_id}")
+def enqueue_download(video_id: str):
+    """Queue a download (or join the one already running) and return its job."""
+    job = jobs.submit(video_id)
+    return JSONResponse(job, status_code=200 if job["status"] == "done" else 202)
+
+@router.get("/jobs/{job_id}")
+def download_status(job_id: str):
+    """Progress of a queued download job."""
+    job = jobs.get(job_id)
+    if not job:
+        return JSONResponse({"error": f"Job {job_id} not found"}, status_code=404)
+    return job
 
 @router.get("/{video_id}")
 def download_song(video_id: str):
-    """Download YouTube song as audio file"""
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "outtmpl": f"{DOWNLOAD_PATH}/%(title)s.%(ext)s",
-        "quiet": True,
-        "noplaylist": True,
-        "postprocessors": [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "192"
-        }]
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
-        filename = ydl.prepare_filename(info).replace(".webm", ".mp3").replace(".m4a", ".mp3")
-    return {
-        "message": "Downloaded successfully",
-        "title": info["title"],
-        "file": os.path.abspath(filename)
-    }
+    """Return a finished download right away, otherwise queue it like POST does."""
+    done = jobs.finished(video_id)
+    if done:
+        return {
+            "message": "Downloaded successfully",
+            "title": done["title"],
+            "file": done["file"]
+        }
+    return enqueue_download(video_id)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import and_, bindparam, func, select, update
+from sqlalchemy.orm import Session, joinedload
 from pydantic import BaseModel
 from utils import db
 
-router = APIRouter(prefix="/api/playlists", tags=["playlists"])
+# init_db adds the position column / indexes to databases created before they
+# existed; it runs at app startup (once this router is included), not at import
+router = APIRouter(prefix="/api/playlists", tags=["playlists"], on_startup=[db.init_db])
+
+ps = db.playlist_songs
 
 # --------------------------------------------------
 # Dependency for DB session
@@ -21,6 +27,28 @@ def get_db():
 class PlaylistCreate(BaseModel):
     name: str
 
+class SongIds(BaseModel):
+    song_ids: List[int]
+
+# --------------------------------------------------
+# Helpers
+# --------------------------------------------------
+def song_dict(s):
+    return {"id": s.id, "title": s.title, "artist": s.artist, "url": s.url}
+
+def next_position(database: Session, playlist_id: int) -> int:
+    # served from ix_playlist_songs_position
+    last = database.execute(
+        select(func.max(ps.c.position)).where(ps.c.playlist_id == playlist_id)
+    ).scalar()
+    return 0 if last is None else last + 1
+
+def existing_song_ids(database: Session, playlist_id: int, song_ids) -> set:
+    rows = database.execute(
+        select(ps.c.song_id).where(ps.c.playlist_id == playlist_id, ps.c.song_id.in_(song_ids))
+    )
+    return {r[0] for r in rows}
+
 # --------------------------------------------------
 # Create a new playlist
 # --------------------------------------------------
@@ -36,37 +64,45 @@ def create_playlist(playlist: PlaylistCreate, database: Session = Depends(get_db
     }
 
 # --------------------------------------------------
-# Get all playlists with songs
+# Get playlists with songs, one page at a time
+# (cursor = last playlist id of the previous page)
 # --------------------------------------------------
 @router.get("/")
-def get_all_playlists(database: Session = Depends(get_db)):
-    playlists = database.query(db.Playlist).all()
-    result = []
-    for playlist in playlists:
-        result.append({
-            "id": playlist.id,
-            "name": playlist.name,
-            "songs": [
-                {"id": s.id, "title": s.title, "artist": s.artist, "url": s.url}
-                for s in playlist.songs
-            ]
-        })
-    return result
+def get_all_playlists(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = Query(None),
+    database: Session = Depends(get_db),
+):
+    query = database.query(db.Playlist).options(joinedload(db.Playlist.songs))
+    if cursor is not None:
+        query = query.filter(db.Playlist.id > cursor)
+    # one joined query; fetch one extra row to know whether another page exists
+    playlists = query.order_by(db.Playlist.id).limit(limit + 1).all()
+    page = playlists[:limit]
+    return {
+        "playlists": [
+            {"id": p.id, "name": p.name, "songs": [song_dict(s) for s in p.songs]}
+            for p in page
+        ],
+        "next_cursor": page[-1].id if len(playlists) > limit else None,
+    }
 
 # --------------------------------------------------
 # Add a song to playlist
 # --------------------------------------------------
 @router.post("/{playlist_id}/add/{song_id}")
 def add_song_to_playlist(playlist_id: int, song_id: int, database: Session = Depends(get_db)):
-    playlist = database.query(db.Playlist).filter(db.Playlist.id == playlist_id).first()
-    song = database.query(db.Song).filter(db.Song.id == song_id).first()
+    playlist = database.get(db.Playlist, playlist_id)
+    song = database.get(db.Song, song_id)
     if not playlist:
         return {"error": f"Playlist {playlist_id} not found"}
     if not song:
         return {"error": f"Song {song_id} not found"}
-    if song in playlist.songs:
+    if existing_song_ids(database, playlist_id, [song_id]):
         return {"message": "Song already in playlist"}
-    playlist.songs.append(song)
+    database.execute(ps.insert().values(
+        playlist_id=playlist_id, song_id=song_id, position=next_position(database, playlist_id)
+    ))
     database.commit()
     return {"message": f"Added '{song.title}' to '{playlist.name}'"}
 
@@ -75,31 +111,108 @@ def add_song_to_playlist(playlist_id: int, song_id: int, database: Session = Dep
 # --------------------------------------------------
 @router.delete("/{playlist_id}/remove/{song_id}")
 def remove_song_from_playlist(playlist_id: int, song_id: int, database: Session = Depends(get_db)):
-    playlist = database.query(db.Playlist).filter(db.Playlist.id == playlist_id).first()
-    song = database.query(db.Song).filter(db.Song.id == song_id).first()
+    playlist = database.get(db.Playlist, playlist_id)
+    song = database.get(db.Song, song_id)
     if not playlist:
         return {"error": f"Playlist {playlist_id} not found"}
     if not song:
         return {"error": f"Song {song_id} not found"}
-    if song not in playlist.songs:
+    result = database.execute(
+        ps.delete().where(ps.c.playlist_id == playlist_id, ps.c.song_id == song_id)
+    )
+    if not result.rowcount:
         return {"message": "Song not in playlist"}
-    playlist.songs.remove(song)
     database.commit()
     return {"message": f"Removed '{song.title}' from '{playlist.name}'"}
 
 # --------------------------------------------------
-# Get one playlist by ID
+# Batch add songs (appended in the given order, one transaction)
+# --------------------------------------------------
+@router.post("/{playlist_id}/songs")
+def add_songs_to_playlist(playlist_id: int, body: SongIds, database: Session = Depends(get_db)):
+    if not database.get(db.Playlist, playlist_id):
+        return {"error": f"Playlist {playlist_id} not found"}
+    wanted = list(dict.fromkeys(body.song_ids))
+    known = {r[0] for r in database.execute(select(db.Song.id).where(db.Song.id.in_(wanted)))}
+    present = existing_song_ids(database, playlist_id, wanted)
+    to_add = [sid for sid in wanted if sid in known and sid not in present]
+    if to_add:
+        start = next_position(database, playlist_id)
+        database.execute(ps.insert(), [
+            {"playlist_id": playlist_id, "song_id": sid, "position": start + i}
+            for i, sid in enumerate(to_add)
+        ])
+        database.commit()
+    return {
+        "added": to_add,
+        "already_present": [sid for sid in wanted if sid in present],
+        "not_found": [sid for sid in wanted if sid not in known],
+    }
+
+# --------------------------------------------------
+# Batch remove songs (one transaction)
+# --------------------------------------------------
+@router.post("/{playlist_id}/songs/remove")
+def remove_songs_from_playlist(playlist_id: int, body: SongIds, database: Session = Depends(get_db)):
+    if not database.get(db.Playlist, playlist_id):
+        return {"error": f"Playlist {playlist_id} not found"}
+    result = database.execute(
+        ps.delete().where(ps.c.playlist_id == playlist_id, ps.c.song_id.in_(body.song_ids))
+    )
+    database.commit()
+    return {"removed": result.rowcount}
+
+# --------------------------------------------------
+# Reorder songs: the given songs move to the front in the given
+# order, the rest keep their relative order after them
+# --------------------------------------------------
+@router.put("/{playlist_id}/songs/order")
+def reorder_playlist(playlist_id: int, body: SongIds, database: Session = Depends(get_db)):
+    if not database.get(db.Playlist, playlist_id):
+        return {"error": f"Playlist {playlist_id} not found"}
+    current = [r[0] for r in database.execute(
+        select(ps.c.song_id).where(ps.c.playlist_id == playlist_id).order_by(ps.c.position)
+    )]
+    members = set(current)
+    front = [sid for sid in dict.fromkeys(body.song_ids) if sid in members]
+    moved = set(front)
+    order = front + [sid for sid in current if sid not in moved]
+    if order:
+        database.execute(
+            update(ps)
+            .where(and_(ps.c.playlist_id == playlist_id, ps.c.song_id == bindparam("sid")))
+            .values(position=bindparam("pos")),
+            [{"sid": sid, "pos": i} for i, sid in enumerate(order)],
+        )
+        database.commit()
+    return {"order": order}
+
+# --------------------------------------------------
+# Get one playlist by ID, songs paged by position
+# (cursor = position of the last song on the previous page)
 # --------------------------------------------------
 @router.get("/{playlist_id}")
-def get_playlist(playlist_id: int, database: Session = Depends(get_db)):
-    playlist = database.query(db.Playlist).filter(db.Playlist.id == playlist_id).first()
+def get_playlist(
+    playlist_id: int,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[int] = Query(None),
+    database: Session = Depends(get_db),
+):
+    playlist = database.get(db.Playlist, playlist_id)
     if not playlist:
         return {"error": f"Playlist {playlist_id} not found"}
+    query = (
+        select(db.Song, ps.c.position)
+        .join(ps, ps.c.song_id == db.Song.id)
+        .where(ps.c.playlist_id == playlist_id)
+    )
+    if cursor is not None:
+        query = query.where(ps.c.position > cursor)
+    rows = database.execute(query.order_by(ps.c.position).limit(limit + 1)).all()
+    page = rows[:limit]
     return {
         "id": playlist.id,
         "name": playlist.name,
-        "songs": [
-            {"id": s.id, "title": s.title, "artist": s.artist, "url": s.url}
-            for s in playlist.songs
-        ]
+        "songs": [song_dict(s) for s, _ in page],
+        "next_cursor": page[-1][1] if len(rows) > limit else None,
     }
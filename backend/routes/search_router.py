@@ -1,22 +1,22 @@
 from fastapi import APIRouter, Query, HTTPException
-import yt_dlp
+from utils.extractor import ydl_pool
 
 router = APIRouter()
 
+ydl_pool.register("search_top5", {
+    "quiet": True,
+    "skip_download": True,
+    "extract_flat": "in_playlist",  # ✅ Required for ytsearch to work
+    "default_search": "ytsearch5",  # ✅ Get top 5 results
+})
+
 @router.get("/search")
 def search_songs(q: str = Query(..., description="Song name or keyword to search")):
     """
     Search YouTube for songs matching the query and return top results.
     """
     try:
-        ydl_opts = {
-            "quiet": True,
-            "skip_download": True,
-            "extract_flat": "in_playlist",  # ✅ Required for ytsearch to work
-            "default_search": "ytsearch5",  # ✅ Get top 5 results
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with ydl_pool.checkout("search_top5") as ydl:
             info = ydl.extract_info(q, download=False)
 
         if not info:
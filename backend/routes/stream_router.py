@@ -1,27 +1,29 @@
 from fastapi import APIRouter, Query, HTTPException
-import yt_dlp
+from utils.extractor import ydl_pool
 
 router = APIRouter()
 
+ydl_pool.register("stream_direct", {
+    "quiet": True,
+    "format": "bestaudio/best",
+    "noplaylist": True,
+    "geo_bypass": True,
+    "extract_flat": False,
+    "skip_download": True,
+    "nocheckcertificate": True,
+    "source_address": "0.0.0.0",
+})
+
 @router.get("/stream")
 def get_stream(url: str = Query(..., description="YouTube video URL")):
     """
     Extract a direct audio stream URL from a YouTube video using yt_dlp.
     Handles cases where abr is missing.
     """
+    from yt_dlp.utils import DownloadError
+
     try:
-        ydl_opts = {
-            "quiet": True,
-            "format": "bestaudio/best",
-            "noplaylist": True,
-            "geo_bypass": True,
-            "extract_flat": False,
-            "skip_download": True,
-            "nocheckcertificate": True,
-            "source_address": "0.0.0.0",
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with ydl_pool.checkout("stream_direct") as ydl:
             info = ydl.extract_info(url, download=False)
 
         if not info:
@@ -43,7 +45,7 @@ def get_stream(url: str = Query(..., description="YouTube video URL")):
 
         return {"stream_url": best_audio.get("url")}
 
-    except yt_dlp.utils.DownloadError as e:
+    except DownloadError as e:
         raise HTTPException(status_code=500, detail=f"yt-dlp download error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Stream extraction failed: {str(e)}")
@@ -0,0 +1,35 @@
+"""Shared fixtures: the app runs in a scratch directory against benchmarks/fake_youtube.py."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+# main.py and the utils keep their files relative to the working directory
+os.chdir(tempfile.mkdtemp(prefix="nebula-tests-"))
+# the fake backend answers in milliseconds; pacing it would only slow the tests down
+os.environ.setdefault("NEBULA_UPSTREAM_RATE", "1000")
+os.environ.setdefault("NEBULA_UPSTREAM_BURST", "1000")
+
+
+@pytest.fixture(scope="session")
+def googlevideo():
+    from benchmarks.fake_youtube import start_googlevideo
+
+    return start_googlevideo()
+
+
+@pytest.fixture(scope="session")
+def client(googlevideo):
+    from fastapi.testclient import TestClient
+    from benchmarks.fake_youtube import install
+
+    install(0.01, 5, googlevideo)
+    from main import app
+
+    with TestClient(app) as c:
+        yield c
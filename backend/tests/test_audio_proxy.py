@@ -0,0 +1,86 @@
+from urllib.parse import urlparse
+
+from benchmarks.fake_youtube import AUDIO_BYTES, REVOKED
+
+# one video per test: a track started twice is served from the audio cache afterwards
+
+
+def test_full_body(client):
+    r = client.get("/stream/audio/aUdIoPrOxY1")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "audio/mp4"
+    assert r.headers["accept-ranges"] == "bytes"
+    assert len(r.content) == AUDIO_BYTES
+
+
+def test_range_passthrough(client):
+    r = client.get("/stream/audio/aUdIoPrOxY2", headers={"Range": "bytes=1000-1999"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 1000-1999/{AUDIO_BYTES}"
+    assert r.headers["content-length"] == "1000"
+    assert r.content == bytes((1000 + i) % 256 for i in range(1000))
+
+
+def test_refused_url_is_resolved_again(client):
+    video = "aUdIoPrOxY3"
+    old = client.get("/stream", params={"url": video}).json()["url"]
+    parsed = urlparse(old)
+    REVOKED.add(f"{parsed.path}?{parsed.query}")
+
+    r = client.get(f"/stream/audio/{video}", headers={"Range": "bytes=0-99"})
+    assert r.status_code == 206
+    assert len(r.content) == 100
+
+    new = client.get("/stream", params={"url": video}).json()["url"]
+    assert new != old
+
+
+def test_refused_twice_is_502(client):
+    import main
+
+    video = "aUdIoPrOxY4"
+    # every URL the fake signs for this video is refused
+    original = main.open_upstream
+
+    def refuse(url, range_header=None):
+        parsed = urlparse(url)
+        REVOKED.add(f"{parsed.path}?{parsed.query}")
+        return original(url, range_header)
+
+    main.open_upstream = refuse
+    try:
+        r = client.get(f"/stream/audio/{video}")
+    finally:
+        main.open_upstream = original
+    assert r.status_code == 502
+
+
+def test_only_play_starts_make_a_track_hot(client, tmp_path, monkeypatch):
+    from utils import audio_cache
+    from utils.audio_cache import AudioCache
+
+    cache = AudioCache(str(tmp_path), 10**9, hot_after=2)
+    for _ in range(5):
+        cache.get("aUdIoPrOxY6", "m4a", play_start=False, client="a")
+    assert not cache.is_hot("aUdIoPrOxY6", "m4a")
+
+    cache.get("aUdIoPrOxY6", "m4a", play_start=True, client="a")
+    cache.get("aUdIoPrOxY6", "m4a", play_start=True, client="a")  # same play: probe, reload
+    assert not cache.is_hot("aUdIoPrOxY6", "m4a")
+    cache.get("aUdIoPrOxY6", "m4a", play_start=True, client="b")
+    assert cache.is_hot("aUdIoPrOxY6", "m4a")
+
+    monkeypatch.setattr(audio_cache, "PLAY_START_WINDOW", 0)
+    cache.get("aUdIoPrOxY7", "m4a", client="a")
+    cache.get("aUdIoPrOxY7", "m4a", client="a")
+    assert cache.is_hot("aUdIoPrOxY7", "m4a")
+
+
+def test_seeking_does_not_fill_the_audio_cache(client):
+    import main
+
+    video = "aUdIoPrOxY8"
+    for start in (0, 1000, 2000, 3000):
+        r = client.get(f"/stream/audio/{video}", headers={"Range": f"bytes={start}-"})
+        assert r.status_code == 206
+    assert not main.audio_cache.is_hot(video, main.AUDIO_FORMAT)
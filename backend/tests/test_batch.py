@@ -0,0 +1,25 @@
+import main
+
+
+def test_invalid_ids_fail_per_item_without_extracting(client, monkeypatch):
+    extracted = []
+    real = main.get_metadata
+
+    async def spy(video_id, refresh=False):
+        extracted.append(video_id)
+        return await real(video_id, refresh)
+
+    monkeypatch.setattr(main, "get_metadata", spy)
+    ids = ["bAtChVaLiD1", "notvalid", "https://www.youtube.com/watch?v=bAtChVaLiD2", "bAtChVaLiD1"]
+    for path in ("/stream/batch", "/track_info/batch"):
+        items = client.post(path, json={"videoIds": ids}).json()["items"]
+        assert [i["videoId"] for i in items] == ids[:3]
+        assert "error" not in items[0]
+        assert items[1]["error"] == items[2]["error"] == "Invalid videoId"
+    assert set(extracted) == {"bAtChVaLiD1"}
+
+
+def test_malformed_body_is_400(client):
+    for body in ("{not json", '{"videoIds": "bAtChVaLiD1"}', '{"videoIds": [1]}', "[]"):
+        r = client.post("/stream/batch", content=body, headers={"Content-Type": "application/json"})
+        assert r.status_code == 400, body
@@ -0,0 +1,129 @@
+import sqlite3
+import time
+
+import pytest
+
+from utils.cache import SharedCache, SharedWriter, TieredCache, TTLCache, url_expiry, url_ttl
+
+
+@pytest.fixture
+def tiers(tmp_path):
+    """Two workers' caches over one shared file."""
+    path = str(tmp_path / "cache.db")
+
+    def worker():
+        return TieredCache(TTLCache(maxsize=10, ttl=60, name="t"), SharedCache(path, "t"))
+
+    return worker(), worker(), SharedWriter.for_path(path)
+
+
+def test_shared_entry_is_promoted_into_l1(tiers):
+    a, b, writer = tiers
+    a.set("k", {"v": 1}, ttl=30)
+    writer.flush()
+    assert b.get("k") == {"v": 1}
+    assert b.shared.hits == 1
+    assert 25 < b.local.remaining("k") <= 30  # L1 keeps it only for the time it has left
+    assert b.get("k") == {"v": 1}
+    assert b.shared.hits == 1  # the second read never left the process
+
+
+def test_expired_shared_entry_is_a_miss(tiers):
+    a, b, writer = tiers
+    a.set("k", "v", ttl=0.05)
+    writer.flush()
+    time.sleep(0.1)
+    assert b.get("k") is None
+    assert a.get("k") is None
+
+
+def test_pop_hides_the_shared_entry_at_once(tiers):
+    a, b, writer = tiers
+    a.set("k", "v")
+    writer.flush()
+    a.pop("k")
+    assert a.get("k") is None  # even before the delete is written
+    writer.flush()
+    assert b.get("k") is None
+
+
+def test_writes_never_wait_for_a_locked_file(tiers, tmp_path):
+    a, b, writer = tiers
+    a.set("warm", "v")
+    writer.flush()
+    other = sqlite3.connect(tmp_path / "cache.db", isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # another worker holds the write lock
+    try:
+        start = time.perf_counter()
+        a.set("k", "v")
+        assert a.get("k") == "v"  # served from L1
+        assert b.get("warm") == "v"  # WAL readers are not blocked
+        assert time.perf_counter() - start < 0.05
+    finally:
+        other.execute("ROLLBACK")
+    writer.flush()
+    assert b.get("k") == "v"
+
+
+def test_row_cap(tmp_path):
+    path = str(tmp_path / "capped.db")
+    writer = SharedWriter.for_path(path)
+    writer.max_rows = 5
+    cache = SharedCache(path, "t")
+    for i in range(8):
+        cache.set(f"k{i}", i, ttl=100 + i)
+    cache.sweep()
+    writer.flush()
+    assert writer.trimmed == 3
+    # the entries closest to expiry went first
+    assert [cache.get(f"k{i}") for i in range(8)] == [None, None, None, 3, 4, 5, 6, 7]
+
+
+def test_ttlcache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recent
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttlcache_entries_expire_on_their_own_deadline(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("short", 1, ttl=5)
+    cache.set("default", 2)
+    cache.set("never", 3, ttl=0)  # not stored at all
+    assert "never" not in cache
+
+    now[0] += 10
+    assert cache.get("short") is None
+    assert cache.get("default") == 2
+    assert cache.remaining("default") == 50
+    now[0] += 60
+    assert cache.sweep() == 1
+    assert len(cache) == 0
+    assert cache.expirations == 2
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://r1.googlevideo.com/videoplayback?expire=1000&id=x", 1000),
+    ("https://manifest.googlevideo.com/api/manifest/dash/expire/1000/id/x", 1000),
+    ("https://r1.googlevideo.com/videoplayback?id=x", None),
+    ("https://r1.googlevideo.com/videoplayback?expire=soon", None),
+    ("https://manifest.googlevideo.com/api/manifest/dash/expire", None),
+    (None, None),
+])
+def test_url_expiry(url, expected):
+    assert url_expiry(url) == expected
+
+
+def test_url_ttl(monkeypatch):
+    monkeypatch.setattr(time, "time", lambda: 1000.0)
+    assert url_ttl("https://r1.googlevideo.com/videoplayback?expire=4600", 99, margin=300) == 3300
+    assert url_ttl("https://r1.googlevideo.com/videoplayback?id=x", 99) == 99  # no expiry: the default
+    assert url_ttl("https://r1.googlevideo.com/videoplayback?expire=1200", 99, margin=300) == 0  # within the margin
+    assert url_ttl("https://r1.googlevideo.com/videoplayback?expire=500", 99) == 0  # already expired
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from utils import dedupe
+from utils.dedupe import canonical, dedupe as dedupe_tracks, fingerprints, signatures
+
+
+@pytest.mark.parametrize("title, uploader, expected", [
+    ("Calvin Harris feat. Rihanna - This Is What You Came For", "CalvinHarrisVEVO",
+     ("this is what you came for", "calvin harris", True)),
+    ("Artist ft. X - Song (Official Video)", "Someone", ("song", "artist", True)),
+    ("Artist - Song (feat. X) [HD]", "Someone", ("song", "artist", True)),
+    ("Song feat. X | Live at Wembley", "Artist - Topic", ("song live at wembley", "artist", True)),
+    ("Video Games", "Lana Del Rey - Topic", ("video games", "lana del rey", True)),
+    ("Clean", "Taylor Swift - Topic", ("clean", "taylor swift", True)),
+    ("Song - Official Music Video HD", "Lyrics Hub", ("song", "lyrics hub", False)),
+])
+def test_canonical(title, uploader, expected):
+    assert canonical(title, uploader)[:3] == expected
+
+
+@pytest.mark.parametrize("title, reupload", [
+    ("Song (Official Audio)", False),
+    ("Song (Remastered 2011)", False),
+    ("Song [Lyrics]", True),
+    ("Song - slowed + reverb", True),
+    ("Song (Audio)", True),
+    ("Video Games", False),
+])
+def test_reupload_marks(title, reupload):
+    assert canonical(title, "Someone")[3] is reupload
+
+
+def ids(tracks):
+    return [t["videoId"] for t in dedupe_tracks(tracks)]
+
+
+def test_same_title_different_artists_are_kept():
+    tracks = [
+        {"videoId": "a", "title": "Hello", "artist": "Adele"},
+        {"videoId": "b", "title": "Hello", "artist": "Lionel Richie"},
+        {"videoId": "c", "title": "Intro", "artist": "The xx"},
+        {"videoId": "d", "title": "Intro", "artist": "M83"},
+        {"videoId": "e", "title": "Hello (Official Video)", "artist": "AdeleVEVO"},
+    ]
+    assert ids(tracks) == ["a", "b", "c", "d"]
+
+
+def test_reuploads_are_dropped():
+    # the examples the dedupe was asked for: different channels, marked as copies
+    tracks = [
+        {"videoId": "a", "title": "Song (Official Audio)", "artist": "X"},
+        {"videoId": "b", "title": "Song [Lyrics]", "artist": "Y"},
+        {"videoId": "c", "title": "Song - slowed + reverb", "artist": "Z"},
+        {"videoId": "d", "title": "Hello", "artist": "Lyrics Hub"},
+        {"videoId": "e", "title": "Hello", "artist": "Adele"},
+    ]
+    assert ids(tracks) == ["a", "d", "e"]  # "Hello" on a lyrics channel without a mark is not a copy
+
+
+def test_feat_and_plain_upload_are_one_song():
+    tracks = [
+        {"videoId": "a", "title": "Calvin Harris - This Is What You Came For (Official Video) ft. Rihanna"},
+        {"videoId": "b", "title": "Calvin Harris feat. Rihanna - This Is What You Came For"},
+        {"videoId": "c", "title": "Calvin Harris - Summer"},
+    ]
+    assert [t["videoId"] for t in dedupe_tracks(tracks)] == ["a", "c"]
+
+
+def test_fingerprint_cache_overflow_keeps_batch(monkeypatch):
+    monkeypatch.setattr(dedupe, "FINGERPRINT_CACHE", 2)
+    monkeypatch.setattr(dedupe, "_fingerprints", {})
+    fingerprints(["first song", "second song"])
+    songs = ["first song", "third song", "first song"]
+    sig, keys = fingerprints(songs)  # overflows while "first song" is cached
+    assert np.array_equal(sig, signatures(songs))
+    assert len(keys) == 3
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from utils.extractor import SingleFlight, video_id_from_url
+
+VIDEO = "dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url", [
+    VIDEO,
+    f"https://www.youtube.com/watch?v={VIDEO}",
+    f"https://youtube.com/watch?v={VIDEO}&list=PL123&t=42",
+    f"http://m.youtube.com/watch?v={VIDEO}",
+    f"https://music.youtube.com/watch?v={VIDEO}&feature=share",
+    f"www.youtube.com/watch?v={VIDEO}",
+    f"https://youtu.be/{VIDEO}?si=abc",
+    f"https://www.youtube.com/shorts/{VIDEO}",
+    f"https://www.youtube.com/embed/{VIDEO}",
+    f"https://WWW.YouTube.com:443/watch?v={VIDEO}",
+])
+def test_url_forms_share_one_id(url):
+    assert video_id_from_url(url) == VIDEO
+
+
+@pytest.mark.parametrize("url", [
+    f"https://notyoutube.com/watch?v={VIDEO}",
+    f"https://www.youtube.com.evil.com/watch?v={VIDEO}",
+    f"https://youtu.be.evil.com/{VIDEO}",
+    f"https://notyoutu.be/{VIDEO}",
+    f"https://evil.com/watch?v={VIDEO}&u=youtube.com",
+    "https://www.youtube.com/watch?v=short",
+    "",
+])
+def test_other_hosts_and_bad_ids_are_rejected(url):
+    assert video_id_from_url(url) is None
+
+
+def test_concurrent_url_forms_share_one_extraction(monkeypatch):
+    import main
+
+    calls = []
+
+    async def fetch(video_id):
+        calls.append(video_id)
+        await asyncio.sleep(0.05)
+        return {"url": f"https://example.invalid/videoplayback?id={video_id}"}
+
+    monkeypatch.setattr(main, "fetch_metadata", fetch)
+    video = "cOaLeScEd01"
+    forms = [video, f"https://youtu.be/{video}", f"https://music.youtube.com/watch?v={video}"]
+
+    async def resolve_all():
+        return await asyncio.gather(*(main.get_stream_url(url) for url in forms))
+
+    results = asyncio.run(resolve_all())
+    assert calls == [video]
+    assert {url for url, _ in results} == {f"https://example.invalid/videoplayback?id={video}"}
+
+
+def test_single_flight_survives_a_cancelled_waiter():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.run("k", work))
+        second = asyncio.ensure_future(flight.run("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+        assert "k" not in flight
+
+    asyncio.run(scenario())
+    assert calls == [1]
@@ -0,0 +1,37 @@
+import json
+
+from utils.history import PlayHistory
+from utils.recommender import PLAY_WEIGHT, Recommender
+
+
+def play(vid, t):
+    return {"t": t, "videoId": vid, "title": f"Song {vid}", "artist": "Artist", "thumbnail": None}
+
+
+def play_links(recommender, vid):
+    # recommend() leaves out what was just played, so look at the learned weights
+    row = recommender._rows.get(recommender._index.get(vid), {})
+    return {recommender._ids[i]: w for i, w in row.items()}
+
+
+def test_replayed_log_seeds_recommender(tmp_path):
+    log = tmp_path / "plays.log"
+    # a -> b twice; c is played hours later, so it does not follow b
+    events = [play("a", 1000), play("b", 1100), play("a", 1200), play("b", 1300), play("c", 9000)]
+    log.write_text("".join(json.dumps(e) + "\n" for e in events))
+    recommender = Recommender()
+    history = PlayHistory(log)
+    history.listeners.append(lambda e: recommender.observe_play(e["videoId"], e, e["t"]))
+
+    history.load()
+    assert play_links(recommender, "b") == {"a": 3 * PLAY_WEIGHT}
+    assert play_links(recommender, "c") == {}
+
+
+def test_recorded_plays_feed_recommender(client):
+    import main
+
+    for vid in ("pLaYoRdEr01", "pLaYoRdEr02"):
+        body = {"videoId": vid, "title": f"Song {vid}", "artist": "Artist"}
+        assert client.post("/play", json=body).json() == {"recorded": True}
+    assert play_links(main.recommender, "pLaYoRdEr01")["pLaYoRdEr02"] == PLAY_WEIGHT
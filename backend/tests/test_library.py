@@ -0,0 +1,138 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from conftest import BACKEND
+from utils.library import LibraryStore
+
+
+def store(path, compact_every=500):
+    return LibraryStore(path / "playlists.json", path / "liked_songs.json", path / "library.journal", compact_every)
+
+
+def song(vid):
+    return {"videoId": vid, "title": f"Song {vid}", "artist": "Artist", "thumbnail": None}
+
+
+def test_workers_see_each_others_writes(tmp_path):
+    a, b = store(tmp_path), store(tmp_path)
+    pid = a.create_playlist("shared")["id"]
+    assert b.add_song(pid, song("x1")) is True
+    assert [s["videoId"] for s in a.playlist_songs(pid)] == ["x1"]
+    assert b.create_playlist("second")["id"] == pid + 1  # ids come from the shared state
+    since = a.version
+    b.toggle_like(song("x2"))
+    delta = a.changes(since, a.epoch)
+    assert not delta["full"] and delta["liked"]["added"] == [song("x2")]
+    assert a.etag("liked") == b.etag("liked")
+
+
+def test_compaction_keeps_other_workers_writes(tmp_path):
+    a, b = store(tmp_path), store(tmp_path)
+    pid = a.create_playlist("shared")["id"]
+    b.add_song(pid, song("x1"))
+    a.compact()
+    b.add_song(pid, song("x2"))  # b first reloads the snapshot a wrote
+    a.add_song(pid, song("x3"))
+    b.compact()
+    fresh = store(tmp_path)
+    assert [s["videoId"] for s in fresh.playlist_songs(pid)] == ["x1", "x2", "x3"]
+    assert fresh.version == a.version == b.version
+
+
+def test_compaction_runs_in_background(tmp_path):
+    a = store(tmp_path, compact_every=3)
+    a.load()
+    for i in range(3):
+        a.toggle_like(song(f"x{i}"))
+    deadline = time.time() + 5
+    while a._compacting or a._pending:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert not (tmp_path / "library.journal").exists()
+    assert len(json.loads((tmp_path / "liked_songs.json").read_text())["liked"]) == 3
+
+
+def test_concurrent_processes_lose_no_writes(tmp_path):
+    script = (
+        "import sys\n"
+        "from pathlib import Path\n"
+        "from utils.library import LibraryStore\n"
+        "p = Path(sys.argv[1])\n"
+        "s = LibraryStore(p / 'playlists.json', p / 'liked_songs.json', p / 'library.journal', 7)\n"
+        "s.load()\n"
+        "for i in range(200):\n"
+        "    s.toggle_like({'videoId': f'{sys.argv[2]}{i}', 'title': 't'})\n"
+        "s.close()\n"
+    )
+    env = dict(os.environ, PYTHONPATH=str(BACKEND))
+    procs = [
+        subprocess.Popen([sys.executable, "-c", script, str(tmp_path), name], env=env)
+        for name in ("a", "b", "c", "d")
+    ]
+    assert all(p.wait(60) == 0 for p in procs)
+    assert len(store(tmp_path).all_likes()) == 800
+
+
+def test_journal_replayed_after_crash(tmp_path):
+    a = store(tmp_path)
+    pid = a.create_playlist("mix")["id"]
+    a.add_song(pid, song("x1"))
+    a.toggle_like(song("x2"))
+    a.toggle_like(song("x2"))  # unliked again
+    version = a.version
+    # the process dies without close(); its last line was only half written
+    with open(tmp_path / "library.journal", "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": 1, "so')
+
+    b = store(tmp_path)
+    assert [s["videoId"] for s in b.playlist_songs(pid)] == ["x1"]
+    assert b.all_likes() == []
+    assert (b.version, b.epoch) == (version, a.epoch)
+    # the replayed journal was folded into the snapshots at load
+    assert not (tmp_path / "library.journal").exists()
+    assert json.loads((tmp_path / "playlists.json").read_text())["version"] == version
+
+
+def test_compaction_writes_the_old_file_format(tmp_path):
+    a = store(tmp_path, compact_every=2)
+    pid = a.create_playlist("mix")["id"]
+    a.add_song(pid, song("x1"))
+    a.close()
+    playlists = json.loads((tmp_path / "playlists.json").read_text())
+    assert playlists["playlists"] == [{"id": pid, "name": "mix", "songs": [song("x1")]}]
+    assert playlists["version"] == 2
+    assert json.loads((tmp_path / "liked_songs.json").read_text()) == {"liked": [], "version": 2}
+
+
+def test_migrates_files_from_before_versioning(tmp_path):
+    (tmp_path / "playlists.json").write_text(json.dumps({"playlists": [{"id": 3, "name": "old", "songs": [song("x1")]}]}))
+    (tmp_path / "liked_songs.json").write_text(json.dumps({"liked": [song("x2")]}))
+    a = store(tmp_path)
+    assert [pl["id"] for pl in a.all_playlists()] == [3]
+    assert a.all_likes() == [song("x2")]
+    assert a.version == 1
+    assert json.loads((tmp_path / "playlists.json").read_text())["epoch"] == a.epoch
+    # a client that has nothing gets the whole library
+    delta = a.changes(0)
+    assert delta["full"] and delta["liked"] == [song("x2")]
+
+
+def test_epoch_survives_restarts_but_not_a_wipe(tmp_path):
+    a = store(tmp_path)
+    a.toggle_like(song("x1"))
+    a.close()
+    b = store(tmp_path)
+    b.load()
+    assert b.epoch == a.epoch
+    assert not b.changes(b.version, a.epoch)["full"]
+
+    for name in ("playlists.json", "liked_songs.json"):
+        (tmp_path / name).unlink()
+    c = store(tmp_path)
+    c.load()
+    assert c.epoch != a.epoch
+    delta = c.changes(b.version, a.epoch)
+    assert delta["full"] and delta["liked"] == []
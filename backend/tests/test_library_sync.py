@@ -0,0 +1,44 @@
+def like(client, vid):
+    return client.post("/like", params={"videoId": vid, "title": f"Song {vid}", "artist": "Artist"}).json()
+
+
+def test_etag_revalidation(client):
+    first = client.get("/liked/all")
+    etag = first.headers["etag"]
+    assert client.get("/liked/all", headers={"If-None-Match": etag}).status_code == 304
+    # playlists have their own ETag: a like does not invalidate them
+    playlists_etag = client.get("/playlist/all").headers["etag"]
+
+    like(client, "sYnCeTaG001")
+    changed = client.get("/liked/all", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert "sYnCeTaG001" in [s["videoId"] for s in changed.json()["liked"]]
+    assert client.get("/playlist/all", headers={"If-None-Match": playlists_etag}).status_code == 304
+
+
+def test_changes_since_version(client):
+    start = client.get("/library/changes", params={"since": 0}).json()
+    version, epoch = start["version"], start["epoch"]
+
+    pid = client.post("/playlist/create", json={"name": "delta"}).json()["id"]
+    like(client, "sYnCdElTa01")
+    like(client, "sYnCdElTa02")
+    like(client, "sYnCdElTa02")  # unliked
+    delta = client.get("/library/changes", params={"since": version, "epoch": epoch}).json()
+    assert delta["full"] is False and delta["version"] == version + 4
+    assert [pl["id"] for pl in delta["playlists"]["upserted"]] == [pid]
+    assert [s["videoId"] for s in delta["liked"]["added"]] == ["sYnCdElTa01"]
+    assert delta["liked"]["removed"] == ["sYnCdElTa02"]
+
+    client.delete("/playlist/delete", params={"playlist_id": pid})
+    delta = client.get("/library/changes", params={"since": delta["version"], "epoch": epoch}).json()
+    assert delta["playlists"] == {"upserted": [], "deleted": [pid]}
+    assert delta["liked"] == {"added": [], "removed": []}
+
+
+def test_stale_epoch_gets_full_resync(client):
+    current = client.get("/library/changes", params={"since": 0}).json()
+    for params in ({"since": 1, "epoch": "not-this-library"}, {"since": current["version"] + 100}):
+        full = client.get("/library/changes", params=params).json()
+        assert full["full"] is True and full["epoch"] == current["epoch"]
+        assert isinstance(full["playlists"], list) and isinstance(full["liked"], list)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+import lyrics_service
+from lyrics_service import get_lyrics, _lyrics_cache
+
+LYRICS = "line one\nline two\nline three\nline four\nline five"
+
+
+class _LyricsHandler(BaseHTTPRequestHandler):
+    """Stand-in for lyrics.ovh: /<artist>/<title>; the title picks the behaviour."""
+
+    protocol_version = "HTTP/1.1"
+    hits = {}
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        title = unquote(self.path.rsplit("/", 1)[-1])
+        _LyricsHandler.hits[title] = _LyricsHandler.hits.get(title, 0) + 1
+        time.sleep(_LyricsHandler.delay)
+        if title.startswith("missing"):
+            status, body = 404, {"error": "No lyrics found"}
+        else:
+            status, body = 200, {"lyrics": LYRICS}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def lyrics_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _LyricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    original = lyrics_service.LYRICS_API
+    lyrics_service.LYRICS_API = f"http://127.0.0.1:{server.server_address[1]}"
+    yield
+    lyrics_service.LYRICS_API = original
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_handler():
+    _LyricsHandler.hits.clear()
+    _LyricsHandler.delay = 0.0
+
+
+def lyrics(title, artist="Artist"):
+    response = asyncio.run(get_lyrics(title=title, artist=artist))
+    return json.loads(response.body)
+
+
+def ttl_left(title, artist="Artist"):
+    key = f"{artist.lower()}\x1f{title.lower()}"
+    return _lyrics_cache.local._data[key][0] - time.time()
+
+
+def test_hit_is_cached():
+    assert lyrics("found one") == {"lyrics": LYRICS, "source": "api"}
+    assert lyrics("Found  ONE") == {"lyrics": LYRICS, "source": "api"}  # same normalized key
+    assert _LyricsHandler.hits == {"found one": 1}
+    assert ttl_left("found one") > lyrics_service.LYRICS_MISS_TTL
+
+
+def test_miss_is_cached_for_miss_ttl(monkeypatch):
+    assert lyrics("missing one")["source"] == "local"
+    assert lyrics("missing one")["source"] == "local"
+    assert _LyricsHandler.hits == {"missing one": 1}
+    assert lyrics_service.LYRICS_MISS_TTL - 5 < ttl_left("missing one") <= lyrics_service.LYRICS_MISS_TTL
+
+    # once the miss expires the API is asked again
+    monkeypatch.setattr(lyrics_service, "LYRICS_MISS_TTL", 0.2)
+    assert lyrics("missing two")["source"] == "local"
+    time.sleep(0.3)
+    assert lyrics("missing two")["source"] == "local"
+    assert _LyricsHandler.hits["missing two"] == 2
+
+
+def test_concurrent_requests_share_one_call():
+    _LyricsHandler.delay = 0.3
+
+    async def burst():
+        return await asyncio.gather(*(get_lyrics(title="coalesced", artist="Artist") for _ in range(10)))
+
+    responses = asyncio.run(burst())
+    assert all(json.loads(r.body)["source"] == "api" for r in responses)
+    assert _LyricsHandler.hits == {"coalesced": 1}
+
+
+def test_timeout_falls_back_and_retries_soon(monkeypatch):
+    monkeypatch.setattr(lyrics_service, "LYRICS_TIMEOUT", (1, 0.2))
+    _LyricsHandler.delay = 1.0
+    start = time.perf_counter()
+    body = lyrics("slow one")
+    assert time.perf_counter() - start < 1.0
+    assert body["source"] == "local"
+    assert body["lyrics"] == lyrics_service.generate_local_lyrics("slow one", "Artist")
+    # a failure is only cached for LYRICS_ERROR_TTL, not as a miss
+    assert ttl_left("slow one") <= lyrics_service.LYRICS_ERROR_TTL
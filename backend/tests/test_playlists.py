@@ -0,0 +1,24 @@
+import main
+
+
+def add(client, pid, video, title, artist="Adele", **extra):
+    body = {"playlist_id": pid, "videoId": video, "title": title, "artist": artist, **extra}
+    return client.post("/playlist/add", json=body).json()
+
+
+def test_reupload_is_reported_until_playlist_is_deleted(client):
+    pid = client.post("/playlist/create", json={"name": "dupes"}).json()["id"]
+    assert add(client, pid, "pLaYlIsT001", "Adele - Hello") == {"message": "Song added"}
+    assert add(client, pid, "pLaYlIsT002", "Adele - Hello (Lyrics)") == {
+        "message": "Already added", "duplicateOf": "pLaYlIsT001",
+    }
+    assert add(client, pid, "pLaYlIsT003", "Hello", artist="Lionel Richie") == {"message": "Song added"}
+    assert main._playlist_index.get(pid) is not None
+
+    client.delete("/playlist/delete", params={"playlist_id": pid})
+    assert main._playlist_index.get(pid) is None
+
+
+def test_unknown_playlist_gets_no_index(client):
+    assert add(client, 987654, "pLaYlIsT004", "Adele - Hello") == {"error": "Playlist not found"}
+    assert main._playlist_index.get(987654) is None
@@ -0,0 +1,57 @@
+import main
+from utils.recommender import PLAYLIST_WEIGHT, Recommender
+
+
+def song(vid):
+    return {"videoId": vid, "title": f"Song {vid}", "artist": "Artist"}
+
+
+def links(recommender, vid):
+    row = recommender._rows.get(recommender._index.get(vid), {})
+    return {recommender._ids[i]: w for i, w in row.items()}
+
+
+def test_unlike_takes_back_like_links():
+    recommender = Recommender()
+    for vid in ("a", "b", "c"):
+        recommender.observe_like(song(vid))
+    assert recommender.recommend("a")
+
+    recommender.forget_like("b")
+    assert set(links(recommender, "a")) == {"c"}
+    assert links(recommender, "b") == {}
+    recommender.observe_like(song("d"))  # b is no longer a recent like
+    assert "b" not in links(recommender, "d")
+
+    recommender.forget_like("a")
+    recommender.forget_like("c")
+    recommender.forget_like("d")
+    assert not recommender._rows
+    assert recommender._pop.sum() == 0
+
+
+def test_deleted_playlist_keeps_links_from_other_playlists():
+    recommender = Recommender()
+    kept, deleted = [song("a"), song("b")], [song("a"), song("b"), song("c")]
+    recommender.build([{"songs": kept}, {"songs": deleted}], [])
+    assert links(recommender, "a") == {"b": 2 * PLAYLIST_WEIGHT, "c": PLAYLIST_WEIGHT}
+
+    recommender.forget_playlist(deleted)
+    assert links(recommender, "a") == {"b": PLAYLIST_WEIGHT}
+    assert links(recommender, "c") == {}
+    assert recommender.recommend("c") == []
+
+
+def test_endpoints_forget(client):
+    pid = client.post("/playlist/create", json={"name": "forget"}).json()["id"]
+    for vid in ("fOrGeTmE001", "fOrGeTmE002"):
+        client.post("/playlist/add", json={"playlist_id": pid, **song(vid)})
+    assert "fOrGeTmE002" in links(main.recommender, "fOrGeTmE001")
+    client.delete("/playlist/delete", params={"playlist_id": pid})
+    assert "fOrGeTmE002" not in links(main.recommender, "fOrGeTmE001")
+
+    for vid in ("fOrGeTmE003", "fOrGeTmE004"):
+        client.post("/like", params=song(vid))
+    assert "fOrGeTmE004" in links(main.recommender, "fOrGeTmE003")
+    client.post("/like", params=song("fOrGeTmE004"))  # unlike
+    assert "fOrGeTmE004" not in links(main.recommender, "fOrGeTmE003")
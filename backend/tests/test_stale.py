@@ -0,0 +1,37 @@
+import main
+from utils.extractor import ExtractorTimeout
+
+
+def youtube_down(monkeypatch):
+    """From now on every extraction times out; videos fetched before keep their last-known-good metadata."""
+    async def timeout(video_id):
+        raise ExtractorTimeout("YouTube timed out")
+
+    monkeypatch.setattr(main, "fetch_metadata", timeout)
+
+
+def test_stale_stream_is_marked_and_not_cached(client, monkeypatch):
+    video = "sTaLeStReAm"
+    fresh = client.get("/stream", params={"url": video})
+    assert "x-stale" not in fresh.headers
+    main._stream_cache.pop(video)
+    main._meta_cache.pop(video)
+    youtube_down(monkeypatch)
+
+    r = client.get("/stream", params={"url": video})
+    assert r.headers["x-stale"] == "1"
+    assert r.json() == {"url": fresh.json()["url"], "stale": True}
+    assert main._stream_cache.get(video) is None
+
+
+def test_stale_upnext_is_marked_and_not_cached(client, monkeypatch):
+    video = "sTaLeUpNeXt"
+    client.get("/track_info", params={"video_id": video})
+    main._meta_cache.pop(video)
+    youtube_down(monkeypatch)
+
+    r = client.get("/autoplay/upnext", params={"videoId": video})
+    assert r.headers["x-stale"] == "1"
+    assert r.json()["upnext"]
+    assert main._upnext_cache.get(video) is None
+    assert main._last_good.get(f"upnext:{video}") is None
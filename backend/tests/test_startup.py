@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND
+
+
+def test_import_touches_no_files(tmp_path):
+    env = dict(os.environ, PYTHONPATH=str(BACKEND))
+    subprocess.run(
+        [sys.executable, "-c", "import main, lyrics_service, routes.playlists_router, routes.download_router"],
+        cwd=tmp_path, env=env, check=True,
+    )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_ready_after_warmup(client):
+    import time
+
+    deadline = time.time() + 30
+    while client.get("/readyz").status_code != 200:
+        assert time.time() < deadline, client.get("/readyz").json()
+        time.sleep(0.1)
+    body = client.get("/readyz").json()
+    assert {"library", "catalog", "history"} <= set(body["steps"])
+    assert not body["failed"]
+    assert client.get("/playlist/all").status_code == 200
@@ -0,0 +1,63 @@
+import asyncio
+
+from utils.upstream import TokenBucket
+
+
+def test_background_leaves_reserve_for_users():
+    bucket = TokenBucket(rate=0.001, burst=10)
+    taken = sum(asyncio.run(bucket.acquire(0, keep=5)) for _ in range(10))
+    assert taken == 5  # stops once taking another would leave fewer than 5
+    # users still get the reserve without waiting
+    assert all(asyncio.run(bucket.acquire(0)) for _ in range(5))
+    assert not asyncio.run(bucket.acquire(0))
+
+
+def test_cancelled_probe_frees_half_open_slot(monkeypatch):
+    from utils import extractor
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    async def probe():
+        task = asyncio.create_task(extractor.extract("https://youtu.be/pRoBeCaNcEl", "stream"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    upstream = extractor.Upstream(5)
+    upstream.breaker.state, upstream.breaker._opened_at = "open", 0.0  # cooldown long over
+    monkeypatch.setattr(extractor, "upstream", upstream)
+    monkeypatch.setattr(extractor.pool, "run", hang)
+    asyncio.run(probe())
+    upstream.breaker.allow()  # a new probe is let through
+    assert upstream.breaker.state == "half_open"
+
+
+def fresh_upstream(monkeypatch, workers=1, timeout=5):
+    from utils import extractor
+
+    pool = extractor.ExtractionPool(workers, 0, timeout)
+    monkeypatch.setattr(extractor, "pool", pool)
+    monkeypatch.setattr(extractor, "upstream", extractor.Upstream(timeout))
+    return extractor, pool
+
+
+def test_saturated_pool_is_503(client, monkeypatch):
+    _, pool = fresh_upstream(monkeypatch)
+    pool._pending = pool.workers + pool.max_queue
+
+    r = client.get("/track_info", params={"video_id": "sAtUrAtEd01"})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "2"
+    assert "queue is full" in r.json()["error"]
+
+
+def test_extraction_timeout_is_504(client, monkeypatch):
+    import time
+
+    extractor, _ = fresh_upstream(monkeypatch, timeout=0.1)
+    monkeypatch.setattr(extractor, "extract_info", lambda url, profile: time.sleep(0.5))
+
+    r = client.get("/track_info", params={"video_id": "tImEdOuT001"})
+    assert r.status_code == 504
+    assert "timed out" in r.json()["error"]
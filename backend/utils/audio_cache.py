@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger("nebula-backend")
+
+# --------------------------------------------------
+# Audio cache settings
+# --------------------------------------------------
+AUDIO_CACHE_DIR = os.getenv("NEBULA_AUDIO_CACHE_DIR", "data/audio_cache")
+AUDIO_CACHE_BYTES = int(os.getenv("NEBULA_AUDIO_CACHE_MB", "1024")) * 1024 * 1024
+AUDIO_CACHE_POLICY = os.getenv("NEBULA_AUDIO_CACHE_POLICY", "lru")  # lru | lfu
+# A track is copied to disk once it has been started this many times. A player
+# sends several Range requests per play, so only play starts count, and one
+# client's starts of a track within PLAY_START_WINDOW seconds count once.
+AUDIO_CACHE_HOT_AFTER = int(os.getenv("NEBULA_AUDIO_CACHE_HOT_AFTER", "2"))
+PLAY_START_WINDOW = 60
+
+_EXTENSIONS = {"audio/mp4": "m4a", "audio/webm": "webm", "audio/mpeg": "mp3", "audio/ogg": "ogg"}
+MEDIA_TYPES = {ext: mime for mime, ext in _EXTENSIONS.items()}
+
+
+# --------------------------------------------------
+# Content-addressed, size-capped audio store
+# --------------------------------------------------
+class AudioCache:
+    """Audio files on disk keyed by sha256(videoId:format), held under a byte budget.
+
+    Files are written to a temp name and renamed into place, so a reader
+    never sees a partial file. The in-memory index is rebuilt from the
+    directory on startup. When the budget is exceeded the least recently
+    used (``lru``) or least often used (``lfu``) files are removed.
+    """
+
+    def __init__(self, root: str, max_bytes: int, policy: str = "lru", hot_after: int = 2):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.hot_after = hot_after
+        self._lock = threading.Lock()
+        self._index = {}  # digest -> {"path", "size", "hits", "last_used"}
+        self._requests = {}  # digest -> play starts while not cached
+        self._starts = {}  # (client, digest) -> last counted play start
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._loaded = False
+
+    def load(self):
+        """Index the files already on disk; runs at warm-up or on first use."""
+        with self._lock:
+            if self._loaded:
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._scan()
+            self._loaded = True
+
+    @staticmethod
+    def digest(video_id: str, fmt: str) -> str:
+        return hashlib.sha256(f"{video_id}:{fmt}".encode()).hexdigest()
+
+    def _scan(self):
+        for path in self.root.glob("*/*"):
+            if path.name.startswith(".tmp-"):
+                path.unlink(missing_ok=True)
+                continue
+            st = path.stat()
+            self._index[path.stem] = {"path": path, "size": st.st_size, "hits": 0, "last_used": st.st_mtime}
+            self.total_bytes += st.st_size
+        self._evict()
+
+    def get(self, video_id: str, fmt: str, play_start: bool = True, client: str = None):
+        """Return the cached file's Path, or None (and count a play start towards hotness)."""
+        key = self.digest(video_id, fmt)
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not entry["path"].exists():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                if play_start:
+                    self._count_start(key, client)
+                return None
+            entry["hits"] += 1
+            entry["last_used"] = time.time()
+            self.hits += 1
+            return entry["path"]
+
+    def _count_start(self, key: str, client):
+        now = time.time()
+        last = self._starts.get((client, key))
+        if len(self._starts) > 10000:
+            self._starts.clear()
+        self._starts[(client, key)] = now
+        if last is not None and now - last < PLAY_START_WINDOW:
+            return  # the same play (a Safari probe, a seek back to 0, a reload)
+        if len(self._requests) > 10000:
+            self._requests.clear()
+        self._requests[key] = self._requests.get(key, 0) + 1
+
+    def is_hot(self, video_id: str, fmt: str) -> bool:
+        return self._requests.get(self.digest(video_id, fmt), 0) >= self.hot_after
+
+    def put(self, video_id: str, fmt: str, chunks, content_type: str = "audio/mp4"):
+        """Write ``chunks`` (an iterable of bytes) atomically into the cache; return the final Path."""
+        if not self._loaded:
+            self.load()
+        key = self.digest(video_id, fmt)
+        ext = _EXTENSIONS.get((content_type or "").split(";")[0].strip(), "bin")
+        folder = self.root / key[:2]
+        folder.mkdir(exist_ok=True)
+        tmp = folder / f".tmp-{uuid.uuid4().hex}"
+        final = folder / f"{key}.{ext}"
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, final)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        with self._lock:
+            if key in self._index:
+                self.total_bytes -= self._index[key]["size"]
+            self._index[key] = {"path": final, "size": size, "hits": 0, "last_used": time.time()}
+            self.total_bytes += size
+            self._requests.pop(key, None)
+            self._evict()
+        return final
+
+    def _drop(self, key):
+        entry = self._index.pop(key)
+        self.total_bytes -= entry["size"]
+        entry["path"].unlink(missing_ok=True)
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        if self.policy == "lfu":
+            order = sorted(self._index, key=lambda k: (self._index[k]["hits"], self._index[k]["last_used"]))
+        else:
+            order = sorted(self._index, key=lambda k: self._index[k]["last_used"])
+        for key in order:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._drop(key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES, AUDIO_CACHE_POLICY, AUDIO_CACHE_HOT_AFTER)
@@ -0,0 +1,58 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import timed
+
+# --------------------------------------------------
+# Pooled upstream session (keep-alive to googlevideo)
+# --------------------------------------------------
+UPSTREAM_POOL_SIZE = int(os.getenv("NEBULA_UPSTREAM_POOL", "32"))
+UPSTREAM_TIMEOUT = (5, 30)  # connect, read
+CHUNK_SIZE = 64 * 1024
+
+# Headers copied from the upstream response so Range/seek semantics survive the proxy.
+PASSTHROUGH_HEADERS = (
+    "content-type",
+    "content-length",
+    "content-range",
+    "content-encoding",
+    "accept-ranges",
+    "last-modified",
+    "etag",
+)
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=UPSTREAM_POOL_SIZE, max_retries=0)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+
+class UpstreamExpired(Exception):
+    """The signed stream URL was refused (403/410) and needs re-resolving."""
+
+
+def open_upstream(url: str, range_header: str = None) -> requests.Response:
+    """Start a streaming GET for ``url``, forwarding the client's Range header. Blocking."""
+    headers = {"Range": range_header} if range_header else {}
+    with timed("upstream"):
+        resp = session.get(url, headers=headers, stream=True, timeout=UPSTREAM_TIMEOUT)
+    if resp.status_code in (403, 410):
+        resp.close()
+        raise UpstreamExpired(f"Upstream answered {resp.status_code}")
+    return resp
+
+
+def passthrough_headers(resp: requests.Response) -> dict:
+    headers = {k: resp.headers[k] for k in PASSTHROUGH_HEADERS if k in resp.headers}
+    headers.setdefault("accept-ranges", "bytes")
+    return headers
+
+
+def iter_body(resp: requests.Response):
+    """Yield the raw upstream bytes chunk by chunk, returning the connection to the pool at the end."""
+    try:
+        yield from resp.raw.stream(CHUNK_SIZE, decode_content=False)
+    finally:
+        resp.close()
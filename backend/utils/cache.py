@@ -0,0 +1,435 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from utils.metrics import timed
+
+logger = logging.getLogger("nebula-backend")
+
+# Path of the optional cross-worker cache file; empty disables the shared tier.
+SHARED_CACHE_PATH = os.getenv("NEBULA_SHARED_CACHE", "")
+
+_MISSING = object()
+
+
+# --------------------------------------------------
+# Bounded LRU with per-entry expiry
+# --------------------------------------------------
+class TTLCache:
+    """Thread-safe LRU map where every entry carries its own deadline.
+
+    Reads move an entry to the most-recent end; inserts past ``maxsize``
+    evict from the least-recent end. Expired entries are dropped on read
+    and by ``sweep()``, which the background sweeper calls periodically.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.time()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def remaining(self, key) -> float:
+        """Seconds until ``key`` expires (0 if missing); does not count as a hit."""
+        entry = self._data.get(key)
+        return max(0.0, entry[0] - time.time()) if entry else 0.0
+
+    def sweep(self) -> int:
+        """Drop every expired entry and return how many were removed."""
+        now = time.time()
+        with self._lock:
+            dead = [k for k, (expires_at, _) in self._data.items() if expires_at <= now]
+            for k in dead:
+                del self._data[k]
+            self.expirations += len(dead)
+        return len(dead)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# --------------------------------------------------
+# Shared on-disk tier (SQLite, WAL mode)
+# --------------------------------------------------
+# Reads on the request path give up after this long if the file is locked (an L1-only miss).
+SHARED_READ_TIMEOUT = 0.05
+# The writer thread waits this long for other workers' write lock per batch.
+SHARED_WRITE_TIMEOUT = 5
+SHARED_WRITE_QUEUE = 10000  # queued writes past this are dropped (L1 still has them)
+SHARED_WRITE_BATCH = 256  # writes committed in one transaction
+# Rows kept in one cache file; the ones closest to expiry go first.
+SHARED_CACHE_ROWS = int(os.getenv("NEBULA_SHARED_CACHE_ROWS", "200000"))
+SHARED_TRIM_EVERY = 1000  # writes between row-count checks
+
+
+def _connect(path: str, timeout: float) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+        " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS cache_expiry ON cache (expires_at)")
+    return conn
+
+
+class SharedWriter:
+    """Applies the writes for one cache file on a background thread, in batches.
+
+    Callers only enqueue, so a worker waiting for another worker's write lock
+    never stalls the event loop. Every SHARED_TRIM_EVERY writes (and on
+    sweeps) the file is trimmed back to ``max_rows``.
+    """
+
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> "SharedWriter":
+        with cls._writers_lock:
+            writer = cls._writers.get(path)
+            if writer is None:
+                writer = cls._writers[path] = cls(path)
+            return writer
+
+    def __init__(self, path: str, max_rows: int = None):
+        self.path = path
+        self.max_rows = SHARED_CACHE_ROWS if max_rows is None else max_rows
+        self.dropped = 0
+        self.trimmed = 0
+        self._queue = queue.Queue(maxsize=SHARED_WRITE_QUEUE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._since_trim = 0
+
+    def submit(self, sql: str, params, done=None):
+        """Queue one statement (None: trim); ``done`` runs once it is committed (or failed)."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="shared-cache-writer", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait((sql, params, done))
+        except queue.Full:
+            self.dropped += 1
+            if done:
+                done()
+
+    def trim(self):
+        """Queue removal of expired rows and a trim to ``max_rows``."""
+        self.submit(None, None)
+
+    def flush(self):
+        """Block until everything queued so far is written (tests, shutdown)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        conn = None
+        while True:
+            ops = [self._queue.get()]
+            while len(ops) < SHARED_WRITE_BATCH:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = conn or _connect(self.path, SHARED_WRITE_TIMEOUT)
+                with timed("shared_cache"):
+                    self._apply(conn, ops)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared cache write failed ({len(ops)} writes dropped): {e}")
+            finally:
+                for _, _, done in ops:
+                    if done:
+                        done()
+                for _ in ops:
+                    self._queue.task_done()
+
+    def _apply(self, conn: sqlite3.Connection, ops):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params, _ in ops:
+                if sql is not None:
+                    conn.execute(sql, params)
+            self._since_trim += len(ops)
+            if self._since_trim >= SHARED_TRIM_EVERY or any(sql is None for sql, _, _ in ops):
+                self._since_trim = 0
+                self._trim(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _trim(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE (ns, key) IN (SELECT ns, key FROM cache ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+            self.trimmed += excess
+
+
+class SharedCache:
+    """JSON key/value store in a SQLite file that every worker process shares.
+
+    WAL mode lets readers run alongside a writer, so N uvicorn workers can
+    share warm entries, and the file survives restarts and rolling deploys.
+    Writes go through the file's SharedWriter thread; reads stay synchronous
+    but give up after SHARED_READ_TIMEOUT, and a key popped here reads as
+    missing until its delete is written.
+    """
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self.name = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._conn = None
+        self._popping = {}  # key -> pops not yet written
+
+    @property
+    def writer(self) -> SharedWriter:
+        return SharedWriter.for_path(self.path)
+
+    def _db(self) -> sqlite3.Connection:
+        """The read connection, opened (and the table created) on first use."""
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    self._conn = _connect(self.path, SHARED_READ_TIMEOUT)
+        return self._conn
+
+    def get_entry(self, key):
+        """Return ``(expires_at, value)`` for a live entry, else None."""
+        key = str(key)
+        row = None
+        if key not in self._popping:
+            try:
+                with timed("shared_cache"), self._lock:
+                    row = self._db().execute(
+                        "SELECT value, expires_at FROM cache WHERE ns = ? AND key = ? AND expires_at > ?",
+                        (self.namespace, key, time.time()),
+                    ).fetchone()
+            except sqlite3.Error as e:
+                # locked or broken file: serve from L1 only
+                logger.warning(f"Shared cache read failed: {e}")
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[1], json.loads(row[0])
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl: float):
+        if ttl <= 0:
+            return
+        self.writer.submit(
+            "INSERT OR REPLACE INTO cache (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, str(key), json.dumps(value), time.time() + ttl),
+        )
+
+    def pop(self, key):
+        key = str(key)
+        with self._lock:
+            self._popping[key] = self._popping.get(key, 0) + 1
+
+        def done():
+            with self._lock:
+                if self._popping.get(key, 0) > 1:
+                    self._popping[key] -= 1
+                else:
+                    self._popping.pop(key, None)
+
+        self.writer.submit("DELETE FROM cache WHERE ns = ? AND key = ?", (self.namespace, key), done)
+
+    def sweep(self) -> int:
+        """Queue removal of expired rows (and a trim to the row cap); the count is not known here."""
+        self.writer.trim()
+        return 0
+
+
+class TieredCache:
+    """In-process TTLCache in front of a SharedCache; same interface as TTLCache."""
+
+    def __init__(self, local: TTLCache, shared: SharedCache):
+        self.local = local
+        self.shared = shared
+        self.name = local.name
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def __contains__(self, key) -> bool:
+        return key in self.local or self.shared.get_entry(key) is not None
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        entry = self.shared.get_entry(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        # promote into L1 for the time the entry has left
+        self.local.set(key, value, ttl=expires_at - time.time())
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.local.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl=ttl)
+        self.shared.set(key, value, ttl=ttl)
+
+    def pop(self, key, default=None):
+        self.shared.pop(key)
+        return self.local.pop(key, default)
+
+    def remaining(self, key) -> float:
+        return self.local.remaining(key)
+
+    def sweep(self) -> int:
+        return self.local.sweep() + self.shared.sweep()
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        stats.update({
+            "shared_hits": self.shared.hits,
+            "shared_misses": self.shared.misses,
+            "shared_dropped": self.shared.writer.dropped,
+        })
+        return stats
+
+
+def make_cache(name: str, maxsize: int, ttl: float):
+    """Build a per-process LRU, backed by the shared file tier when NEBULA_SHARED_CACHE is set."""
+    local = TTLCache(maxsize=maxsize, ttl=ttl, name=name)
+    if not SHARED_CACHE_PATH:
+        return local
+    return TieredCache(local, SharedCache(SHARED_CACHE_PATH, name))
+
+
+# --------------------------------------------------
+# Signed URL expiry
+# --------------------------------------------------
+def url_expiry(url: str):
+    """Return the unix ``expire`` timestamp embedded in a googlevideo URL, if any."""
+    parsed = urlparse(url or "")
+    value = parse_qs(parsed.query).get("expire", [None])[0]
+    if value is None:
+        # manifest-style URLs carry it as a path segment: /expire/<ts>/
+        parts = parsed.path.split("/")
+        if "expire" in parts and parts.index("expire") + 1 < len(parts):
+            value = parts[parts.index("expire") + 1]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def url_ttl(url: str, default: float, margin: float = 300) -> float:
+    """Seconds a signed URL can safely be handed out for (0 if already too close to expiry)."""
+    expire = url_expiry(url)
+    if expire is None:
+        return default
+    return max(0.0, expire - time.time() - margin)
+
+
+# --------------------------------------------------
+# Key helpers
+# --------------------------------------------------
+def normalize_query(q: str) -> str:
+    """Fold case, unicode compatibility forms and whitespace so equivalent queries share a key."""
+    q = unicodedata.normalize("NFKC", q or "").casefold()
+    return " ".join(q.split())
+
+
+# --------------------------------------------------
+# Background sweeper
+# --------------------------------------------------
+async def sweep_forever(caches, interval: float = 60):
+    while True:
+        await asyncio.sleep(interval)
+        for cache in caches:
+            try:
+                removed = cache.sweep()
+                if removed:
+                    logger.debug(f"{cache.name}: swept {removed} expired entries")
+            except Exception as e:
+                logger.warning(f"Cache sweep failed for {cache.name}: {e}")
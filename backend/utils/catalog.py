@@ -0,0 +1,141 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils.cache import normalize_query
+from utils.metrics import timed
+
+logger = logging.getLogger("nebula-backend")
+
+# --------------------------------------------------
+# Catalog Setup (lives next to data/songs.db)
+# --------------------------------------------------
+CATALOG_PATH = os.getenv("NEBULA_CATALOG", "data/catalog.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id   TEXT PRIMARY KEY,
+    title      TEXT,
+    artist     TEXT,
+    thumbnail  TEXT,
+    duration   INTEGER,
+    seen       INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, artist,
+    content='tracks', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='1 2 3'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, title, artist) VALUES (new.rowid, new.title, new.artist);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, artist) VALUES ('delete', old.rowid, old.title, old.artist);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title, artist ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, artist) VALUES ('delete', old.rowid, old.title, old.artist);
+    INSERT INTO tracks_fts(rowid, title, artist) VALUES (new.rowid, new.title, new.artist);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO tracks (video_id, title, artist, thumbnail, duration, updated_at)
+VALUES (:videoId, :title, :artist, :thumbnail, :duration, :now)
+ON CONFLICT(video_id) DO UPDATE SET
+    title     = COALESCE(excluded.title, title),
+    artist    = COALESCE(excluded.artist, artist),
+    thumbnail = COALESCE(excluded.thumbnail, thumbnail),
+    duration  = COALESCE(excluded.duration, duration),
+    seen      = seen + 1,
+    updated_at = excluded.updated_at
+"""
+
+
+# --------------------------------------------------
+# Local track catalog (SQLite FTS5)
+# --------------------------------------------------
+class Catalog:
+    """Every track the backend has seen, indexed for full-text and prefix search."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        """The connection, opened (and the schema created) on first use."""
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def upsert(self, tracks):
+        """Insert or refresh tracks given in the API's ``{videoId, title, artist, ...}`` shape."""
+        now = time.time()
+        rows = [
+            {
+                "videoId": t.get("videoId"),
+                "title": t.get("title") or None,
+                "artist": t.get("artist") or None,
+                "thumbnail": t.get("thumbnail") or None,
+                "duration": t.get("duration") or None,
+                "now": now,
+            }
+            for t in tracks
+            if t and t.get("videoId")
+        ]
+        if not rows:
+            return
+        try:
+            conn = self._db()
+            with timed("catalog"), self._lock, conn:
+                conn.executemany(_UPSERT, rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Catalog upsert failed: {e}")
+
+    def search(self, q: str, limit: int = 20):
+        """Prefix match on every term of ``q``; best BM25 rank first, then most seen."""
+        terms = [t.replace('"', "") for t in normalize_query(q).split()]
+        terms = [t for t in terms if t]
+        if not terms:
+            return []
+        match = " ".join(f'"{t}"*' for t in terms)
+        try:
+            with timed("catalog"), self._lock:
+                rows = self._db().execute(
+                    "SELECT t.video_id, t.title, t.artist, t.thumbnail FROM tracks_fts"
+                    " JOIN tracks t ON t.rowid = tracks_fts.rowid"
+                    " WHERE tracks_fts MATCH ?"
+                    " ORDER BY bm25(tracks_fts, 2.0, 1.0), t.seen DESC LIMIT ?",
+                    (match, limit),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Catalog search failed: {e}")
+            return []
+        return [
+            {
+                "videoId": vid,
+                "title": title,
+                "artist": artist,
+                "thumbnail": thumbnail or f"https://img.youtube.com/vi/{vid}/hqdefault.jpg",
+            }
+            for vid, title, artist, thumbnail in rows
+        ]
+
+
+catalog = Catalog(CATALOG_PATH)
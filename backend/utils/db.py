@@ -1,6 +1,12 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Table
+import time
+
+from sqlalchemy import (
+    create_engine, event, inspect, Column, Integer, String, ForeignKey, Table, Index, PrimaryKeyConstraint,
+)
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 
+from utils.metrics import observe_stage
+
 # --------------------------------------------------
 # Database Setup
 # --------------------------------------------------
@@ -10,14 +16,28 @@ engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# per-query timings for /metrics
+@event.listens_for(engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    observe_stage("db", time.perf_counter() - conn.info["query_started"].pop())
+
 # --------------------------------------------------
 # Association Table for Playlist <-> Song
+# (one row per song per playlist, ordered by position)
 # --------------------------------------------------
 playlist_songs = Table(
     "playlist_songs",
     Base.metadata,
-    Column("playlist_id", Integer, ForeignKey("playlists.id")),
-    Column("song_id", Integer, ForeignKey("songs.id"))
+    Column("playlist_id", Integer, ForeignKey("playlists.id"), nullable=False),
+    Column("song_id", Integer, ForeignKey("songs.id"), nullable=False),
+    Column("position", Integer, nullable=False, default=0),
+    PrimaryKeyConstraint("playlist_id", "song_id"),
+    Index("ix_playlist_songs_position", "playlist_id", "position"),
+    Index("ix_playlist_songs_song", "song_id"),
 )
 
 # --------------------------------------------------
@@ -30,7 +50,7 @@ class Song(Base):
     artist = Column(String)
     thumbnail = Column(String)
     url = Column(String)
-    playlists = relationship("Playlist", secondary=playlist_songs, back_populates="songs")
+    playlists = relationship("Playlist", secondary=playlist_songs, back_populates="songs", viewonly=True)
 
 # --------------------------------------------------
 # Playlists Table
@@ -39,7 +59,11 @@ class Playlist(Base):
     __tablename__ = "playlists"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
-    songs = relationship("Song", secondary=playlist_songs, back_populates="playlists")
+    # writes go through playlist_songs directly so every row gets a position
+    songs = relationship(
+        "Song", secondary=playlist_songs, back_populates="playlists",
+        order_by=playlist_songs.c.position, viewonly=True,
+    )
 
 # --------------------------------------------------
 # Like Table (Future use)
@@ -55,3 +79,20 @@ class Like(Base):
 # --------------------------------------------------
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _migrate_playlist_songs()
+
+def _migrate_playlist_songs():
+    """Rebuild a pre-position playlist_songs table, keeping insertion order."""
+    columns = {c["name"] for c in inspect(engine).get_columns("playlist_songs")}
+    if "position" in columns:
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE playlist_songs RENAME TO playlist_songs_old")
+        for index in playlist_songs.indexes:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+        playlist_songs.create(conn)
+        conn.exec_driver_sql(
+            "INSERT OR IGNORE INTO playlist_songs (playlist_id, song_id, position) "
+            "SELECT playlist_id, song_id, rowid FROM playlist_songs_old WHERE playlist_id IS NOT NULL AND song_id IS NOT NULL"
+        )
+        conn.exec_driver_sql("DROP TABLE playlist_songs_old")
@@ -0,0 +1,287 @@
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+# --------------------------------------------------
+# Near-duplicate settings
+# --------------------------------------------------
+NUM_PERM = 32  # MinHash signature length
+BANDS = 8  # LSH bands of NUM_PERM // BANDS rows; two titles sharing any band are compared
+SIMILARITY = 0.8  # estimated Jaccard of title 3-grams at which two tracks are the same song
+FINGERPRINT_CACHE = 50000  # titles whose signatures are kept
+DENSE_PAIRS = 1 << 16  # batches with fewer (batch x index) pairs skip LSH and compare everything at once
+_PRIME = (1 << 31) - 1
+
+_rng = np.random.default_rng(0x6E6562)  # fixed: signatures must agree across processes
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_BAND_MULT = _rng.integers(1, 1 << 62, NUM_PERM // BANDS, dtype=np.uint64)
+
+# --------------------------------------------------
+# Title / artist canonicalization
+# --------------------------------------------------
+# upload decorations and re-upload variants; "remix", "live", "acoustic" etc. stay.
+# Only removed inside brackets or as a trailing "- Official Video" part: "Video Games" is a song.
+_NOISE_WORDS = (
+    r"official(?: music| lyrics?)?(?: video| audio| visuali[sz]er)?|music video|lyrics?(?: video)?"
+    r"|with lyrics|visuali[sz]er|audio(?: only)?|video(?: clip)?|m/?v|hd|hq|4k|1080p|explicit|clean"
+    r"|remaster(?:ed)?(?: \d{4})?|\d{4} remaster|slowed(?: down)?|reverb(?:ed)?|sped up|nightcore"
+    r"|8d(?: audio)?|bass boosted|full song"
+)
+_NOISE = re.compile(rf"\b(?:{_NOISE_WORDS})\b")
+# the decorations only someone else's copy of a song carries (not "official audio", "remastered")
+_REUPLOAD = re.compile(
+    r"lyrics?(?: video)?|with lyrics|audio(?: only)?|hd|hq|4k|1080p|slowed(?: down)?|reverb(?:ed)?"
+    r"|sped up|nightcore|8d(?: audio)?|bass boosted|full song"
+)
+_NOISE_SUFFIX = re.compile(rf"(?:\s+[-–—~]+|\s*[|•])\s*(?:(?:{_NOISE_WORDS})\b[\s,&+/]*)+$")
+_BRACKETED = re.compile(r"[(\[{][^(){}\[\]]*[)\]}]")
+# "feat. X" up to a closing bracket, the next " - " / "|" part, or the end
+_FEAT = re.compile(r"[(\[]?\b(?:feat|ft|featuring)\b\.?(?:(?!\s+[-–—~]+\s)[^()\[\]|•])*[)\]]?")
+_EMPTY_BRACKETS = re.compile(r"[(\[{][^\w(){}\[\]]*[)\]}]")
+_ARTIST_SEPARATOR = re.compile(r"\s+[-–—~]+\s+")
+_EXTRA_SEPARATOR = re.compile(r"\s*[|•]\s*")
+_LABEL_CHANNEL = re.compile(r"\s*-\s*topic$|vevo$")
+_NON_WORD = re.compile(r"[\W_]+")
+_NUMBER = re.compile(r"\d+")
+
+
+def fold(text: str) -> str:
+    """Casefold and strip accents/compatibility forms ("Beyoncé" -> "beyonce", "ＭＶ" -> "mv")."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def _words(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _strip_noise(text: str):
+    """``text`` without decorations in brackets or a trailing "- ..." part, and the decorations removed."""
+    marks = []
+
+    def strip(m):
+        marks.extend(_NOISE.findall(m[0]))
+        return _NOISE.sub(" ", m[0])
+
+    text = _EMPTY_BRACKETS.sub(" ", _BRACKETED.sub(strip, text)).rstrip()
+    suffix = _NOISE_SUFFIX.search(text)
+    if suffix:
+        marks.extend(_NOISE.findall(suffix[0]))
+        text = text[:suffix.start()]
+    return text, marks
+
+
+@lru_cache(maxsize=20000)
+def canonical(title: str, artist: str = None):
+    """(song, artist, sure, reupload, title words) with decorations removed, e.g.
+    ("Artist - Song (Official Audio) [HD]", "ArtistVEVO") -> ("song", "artist", True, True, {...}).
+
+    The artist comes from an "Artist - Song" title, else from the uploader.
+    ``sure`` is False when it is a plain uploader name, which for re-uploads
+    (lyrics channels, "slowed + reverb" edits) is not the artist at all.
+    ``reupload`` is True when the title carries a decoration such copies add
+    ("[Lyrics]", "(Audio)", "slowed + reverb"); ``title words`` are all words
+    of the title, so an uploader's name can be looked for in it.
+    """
+    words = frozenset(_words(fold(title)).split())
+    text, marks = _strip_noise(_FEAT.sub(" ", fold(title)))
+    reupload = any(_REUPLOAD.fullmatch(m) for m in marks)
+    # "Song | Live at Wembley": what follows a bar describes the version
+    head, *extra = [p for p in _EXTRA_SEPARATOR.split(text) if _words(p)] or [""]
+    parts = [p for p in (_words(p) for p in _ARTIST_SEPARATOR.split(head)) if p]
+    extra = [_words(p) for p in extra]
+    if len(parts) >= 2:
+        return " ".join(parts[1:] + extra), parts[0], True, reupload, words
+    song = " ".join(parts + extra)
+    uploader = fold(artist)
+    label = bool(_LABEL_CHANNEL.search(uploader.strip()))
+    return song, _words(_LABEL_CHANNEL.sub(" ", uploader.strip())), label, reupload, words
+
+
+# --------------------------------------------------
+# MinHash signatures (vectorized over a whole batch)
+# --------------------------------------------------
+def signatures(texts) -> np.ndarray:
+    """One MinHash row per text over its character 3-grams; shape (len(texts), NUM_PERM).
+
+    All 3-grams of the batch are hashed in one pass: texts are joined into a
+    single byte array, each 3-gram is packed into an int, and every
+    permutation's minimum per text is taken with ``np.minimum.reduceat``.
+    Texts shorter than one 3-gram get an all-max row (they never match).
+    """
+    sig = np.full((len(texts), NUM_PERM), _PRIME, dtype=np.uint64)
+    encoded = [f" {t} ".encode() if t else b"" for t in texts]
+    sizes = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    lengths = np.maximum(sizes - 2, 0)  # 3-grams per text
+    if not lengths.any():
+        return sig
+    buf = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    grams = (buf[:-2] << np.uint64(16)) | (buf[1:-1] << np.uint64(8)) | buf[2:]
+    # keep only 3-grams that start and end inside one text
+    shift = (np.cumsum(sizes) - sizes) - (np.cumsum(lengths) - lengths)
+    keep = np.repeat(shift, lengths) + np.arange(lengths.sum())
+    hashed = (_A[:, None] * grams[keep][None, :] + _B[:, None]) % np.uint64(_PRIME)
+    rows = np.flatnonzero(lengths)
+    offsets = np.concatenate(([0], np.cumsum(lengths[rows])[:-1]))
+    sig[rows] = np.minimum.reduceat(hashed, offsets, axis=1).T
+    return sig
+
+
+def _band_keys(sig: np.ndarray) -> np.ndarray:
+    bands = sig.reshape(len(sig), BANDS, NUM_PERM // BANDS)
+    return (bands * _BAND_MULT).sum(axis=2)  # wraps around; only equality matters
+
+
+_fingerprints = {}  # song -> (signature row, band keys)
+
+
+def fingerprints(songs):
+    """Signatures and LSH band keys for ``songs``; only titles not seen before are hashed."""
+    known = {s: _fingerprints.get(s) for s in dict.fromkeys(songs)}
+    missing = [s for s, fp in known.items() if fp is None]
+    if missing:
+        sig = signatures(missing)
+        for song, row, keys in zip(missing, sig, _band_keys(sig).tolist()):
+            known[song] = (row, keys)
+        # the batch reads from ``known``, so clearing here never loses one of its entries
+        if len(_fingerprints) + len(missing) > FINGERPRINT_CACHE:
+            _fingerprints.clear()
+        _fingerprints.update((s, known[s]) for s in missing)
+    found = [known[s] for s in songs]
+    sig = np.array([row for row, _ in found]).reshape(len(found), NUM_PERM)
+    return sig, [keys for _, keys in found]
+
+
+def _same_artist(a, b) -> bool:
+    """Whether two same-titled tracks are by the same artist.
+
+    They are when their artists share a word. An uploader that is not ``sure``
+    may also stand for someone else's song, but only if its own title shows
+    it is a copy: a re-upload decoration, or the other artist's name.
+    """
+    names, sure, reupload, words = a
+    other, other_sure, other_reupload, other_words = b
+    if names & other:
+        return True
+    if not sure and (reupload or (other and other <= words)):
+        return True
+    return not other_sure and (other_reupload or bool(names and names <= other_words))
+
+
+# --------------------------------------------------
+# LSH index
+# --------------------------------------------------
+class DuplicateIndex:
+    """Tracks indexed by MinHash/LSH over their canonical song title.
+
+    A small lookup batch is compared with every indexed track in one array
+    comparison; a large one only with the tracks sharing an LSH band. Two
+    tracks are the same song when the estimated title similarity reaches
+    ``threshold``, the titles contain the same numbers and the artists agree
+    (see _same_artist).
+    """
+
+    def __init__(self, threshold: float = SIMILARITY):
+        self.threshold = threshold
+        self._min_equal = int(np.ceil(threshold * NUM_PERM))  # signature slots that must agree
+        self._lock = threading.Lock()
+        self._sig = np.empty((64, NUM_PERM), dtype=np.uint64)
+        self._tracks = []
+        self._artists = []  # (set of canonical artist words, sure, reupload, title words) per track
+        self._numbers = []  # numbers in the song title ("Part 2", "22"): differing ones mean another song
+        self._ids = {}  # videoId -> row
+        self._keys = []  # LSH band keys per row
+        self._buckets = {}  # (band, key) -> [row]; filled lazily, only large lookups need it
+        self._bucketed = 0
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def _banded(self, sig, keys):
+        """Indexed rows sharing an LSH band with ``sig`` and similar enough to it."""
+        for row in range(self._bucketed, len(self._tracks)):
+            if self._numbers[row] is not None:
+                for band, key in enumerate(self._keys[row]):
+                    self._buckets.setdefault((band, key), []).append(row)
+        self._bucketed = len(self._tracks)
+        rows = {r for band, key in enumerate(keys) for r in self._buckets.get((band, key), ())}
+        if not rows:
+            return []
+        rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        equal = np.count_nonzero(self._sig[rows] == sig, axis=1)
+        return rows[equal >= self._min_equal].tolist()
+
+    def _match(self, numbers: set, artist, rows):
+        for r in sorted(rows):
+            if self._numbers[r] == numbers and _same_artist(artist, self._artists[r]):
+                return self._tracks[r]
+        return None
+
+    def _add(self, track: dict, numbers, artist, sig, keys) -> int:
+        row = len(self._tracks)
+        if row >= len(self._sig):
+            self._sig = np.concatenate([self._sig, np.empty_like(self._sig)])
+        self._sig[row] = sig
+        self._tracks.append(track)
+        self._artists.append(artist)
+        self._numbers.append(numbers)
+        self._keys.append(keys)
+        if track.get("videoId"):
+            self._ids.setdefault(track["videoId"], row)
+        return row
+
+    def _check(self, tracks, lookup: bool = True, add: bool = True):
+        """Look every track up (and index the new ones); return its duplicate per track (None if new)."""
+        parsed = [canonical(t.get("title"), t.get("artist")) for t in tracks]
+        sigs, keys = fingerprints([p[0] for p in parsed])
+        found = []
+        with self._lock:
+            n = len(self._tracks)
+            dense = lookup and len(tracks) * (n + len(tracks)) <= DENSE_PAIRS
+            if dense:
+                # similar[i, r]: batch track i against indexed row r (< n) or batch track r - n
+                pool = np.concatenate([self._sig[:n], sigs])
+                similar = np.count_nonzero(sigs[:, None, :] == pool[None, :, :], axis=2) >= self._min_equal
+            added = {}  # batch position -> row
+            for i, (track, (song, artist, sure, reupload, words)) in enumerate(zip(tracks, parsed)):
+                artist = (set(artist.split()), sure, reupload, words)
+                numbers = set(_NUMBER.findall(song)) if song else None  # None: no title, never matched
+                row = self._ids.get(track.get("videoId"))
+                dup = self._tracks[row] if row is not None else None
+                if lookup and dup is None and song:
+                    if dense:
+                        cols = similar[i, :n + i].nonzero()[0].tolist()
+                        rows = [c if c < n else added.get(c - n) for c in cols]
+                        rows = [r for r in rows if r is not None]
+                    else:
+                        rows = self._banded(sigs[i], keys[i])
+                    dup = self._match(numbers, artist, rows)
+                if add and row is None and dup is None:
+                    added[i] = self._add(track, numbers, artist, sigs[i], keys[i])
+                found.append(dup)
+        return found
+
+    def add(self, tracks):
+        """Index ``tracks`` as they are (no duplicate check)."""
+        self._check(list(tracks), lookup=False)
+
+    def find(self, track: dict):
+        """The indexed track ``track`` duplicates (same videoId or same song), or None."""
+        return self._check([track], add=False)[0]
+
+    def filter(self, tracks):
+        """``tracks`` without near-duplicates of indexed tracks or of earlier entries (which it indexes)."""
+        tracks = list(tracks)
+        found = self._check(tracks)
+        return [t for t, dup in zip(tracks, found) if dup is None]
+
+
+def dedupe(tracks, exclude=(), threshold: float = SIMILARITY):
+    """Keep the first of every group of near-duplicate ``tracks``; drop any that duplicate ``exclude``."""
+    index = DuplicateIndex(threshold)
+    index.add(exclude)
+    return index.filter(tracks)
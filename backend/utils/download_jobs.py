@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.metrics import timed
+
+logger = logging.getLogger("nebula-backend")
+
+DOWNLOAD_WORKERS = int(os.getenv("NEBULA_DOWNLOAD_WORKERS", "2"))
+MAX_FINISHED_JOBS = 500
+
+# the yt-dlp hooks below run on the worker thread that owns the job
+_current = threading.local()
+
+
+def progress_hook(d: dict):
+    job = getattr(_current, "job", None)
+    if job is None:
+        return
+    if d.get("status") == "downloading":
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        job["status"] = "downloading"
+        if total:
+            # the last 10% is reserved for the FFmpeg step
+            job["progress"] = round(90 * d.get("downloaded_bytes", 0) / total, 1)
+    elif d.get("status") == "finished":
+        job["progress"] = 90.0
+
+
+def postprocessor_hook(d: dict):
+    job = getattr(_current, "job", None)
+    if job is not None and d.get("status") == "started":
+        job["status"] = "processing"
+
+
+# --------------------------------------------------
+# Download job queue
+# --------------------------------------------------
+class DownloadQueue:
+    """Background download/transcode jobs with per-video de-duplication.
+
+    ``submit`` returns immediately with a job dict. A video that already has
+    a queued or running job gets that same job back, and a video that was
+    downloaded before (and whose file still exists) is answered from the
+    on-disk index without doing any work.
+    """
+
+    def __init__(self, download, index_file: Path, workers: int = DOWNLOAD_WORKERS):
+        self.download = download  # fn(video_id) -> (title, filepath); blocking
+        self.index_file = Path(index_file)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # job_id -> job
+        self._active = {}  # video_id -> job_id for queued/running jobs
+        self._index = None  # read on first use, not at import
+        self._threads = []
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _ensure_index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load_index()
+
+    def _save_index(self):
+        tmp = self.index_file.with_name(self.index_file.name + ".tmp")
+        with timed("json_io"), open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp, self.index_file)
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f"nebula-download-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def finished(self, video_id: str):
+        """Index entry for an already downloaded video whose file still exists."""
+        self._ensure_index()
+        entry = self._index.get(video_id)
+        if entry and os.path.exists(entry["file"]):
+            return entry
+        return None
+
+    def submit(self, video_id: str) -> dict:
+        self._ensure_index()
+        with self._lock:
+            job_id = self._active.get(video_id)
+            if job_id:
+                return self._jobs[job_id]
+            job = {
+                "id": uuid.uuid4().hex,
+                "video_id": video_id,
+                "status": "queued",
+                "progress": 0.0,
+                "title": None,
+                "file": None,
+                "error": None,
+                "created_at": time.time(),
+            }
+            done = self.finished(video_id)
+            if done:
+                job.update(status="done", progress=100.0, title=done["title"], file=done["file"])
+            else:
+                self._active[video_id] = job["id"]
+                self._queue.put(job)
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > MAX_FINISHED_JOBS:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]["status"] not in ("done", "error"):
+                    break
+                self._jobs.popitem(last=False)
+        self._start_workers()
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            _current.job = job
+            try:
+                job["status"] = "downloading"
+                title, filepath = self.download(job["video_id"])
+                job.update(status="done", progress=100.0, title=title, file=os.path.abspath(filepath))
+                with self._lock:
+                    self._index[job["video_id"]] = {"title": title, "file": job["file"]}
+                    self._save_index()
+            except Exception as e:
+                logger.warning(f"Download {job['video_id']} failed: {e}")
+                job.update(status="error", error=str(e))
+            finally:
+                _current.job = None
+                with self._lock:
+                    self._active.pop(job["video_id"], None)
+                self._queue.task_done()
@@ -0,0 +1,356 @@
+import asyncio
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cache import url_expiry
+from utils.metrics import timed, observe_stage
+from utils.upstream import Upstream, UpstreamUnavailable, UPSTREAM_MAX_WAIT, UPSTREAM_RESERVE, is_video_error
+
+# --------------------------------------------------
+# Extraction pool settings
+# --------------------------------------------------
+EXTRACT_WORKERS = int(os.getenv("NEBULA_EXTRACT_WORKERS", "4"))
+EXTRACT_QUEUE = int(os.getenv("NEBULA_EXTRACT_QUEUE", "32"))
+EXTRACT_TIMEOUT = float(os.getenv("NEBULA_EXTRACT_TIMEOUT", "20"))
+
+
+# Set inside prefetch/warm-up tasks; their jobs only run while a worker stays free for users.
+background = contextvars.ContextVar("nebula_background", default=False)
+
+
+class ExtractorBusy(Exception):
+    """Raised when every worker is busy and the queue is full."""
+
+
+class ExtractorTimeout(Exception):
+    """Raised when a job does not finish before its deadline."""
+
+
+# --------------------------------------------------
+# Bounded worker pool
+# --------------------------------------------------
+class ExtractionPool:
+    """Runs blocking yt-dlp calls on worker threads, off the event loop.
+
+    At most ``workers + max_queue`` jobs are accepted at once; anything
+    beyond that is rejected with ExtractorBusy instead of piling up.
+    A job that times out keeps its slot until the thread really finishes,
+    so the bound holds even when YouTube hangs.
+
+    Jobs submitted while the ``background`` context flag is set are never
+    queued: they are only admitted while at least one worker would still be
+    idle, so user requests always find a free worker ahead of them.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nebula-extract")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def background_limit(self) -> int:
+        return max(1, self.workers - 1)
+
+    def has_background_capacity(self) -> bool:
+        return self._pending < self.background_limit
+
+    @staticmethod
+    def _job(submitted: float, fn, *args):
+        observe_stage("pool_wait", time.perf_counter() - submitted)
+        return fn(*args)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, timeout: float = None):
+        with self._lock:
+            if background.get() and self._pending >= self.background_limit:
+                raise ExtractorBusy("No idle worker for background extraction")
+            if self._pending >= self.workers + self.max_queue:
+                raise ExtractorBusy("Extraction queue is full, try again shortly")
+            self._pending += 1
+        try:
+            # copy the context so stage timings land in the calling request's breakdown
+            ctx = contextvars.copy_context()
+            future = self._executor.submit(ctx.run, self._job, time.perf_counter(), fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # Drops the job if it is still queued; a running thread cannot be interrupted.
+            future.cancel()
+            raise ExtractorTimeout(f"Extraction timed out after {timeout or self.timeout}s")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = ExtractionPool(EXTRACT_WORKERS, EXTRACT_QUEUE, EXTRACT_TIMEOUT)
+
+
+# --------------------------------------------------
+# YoutubeDL option profiles
+# --------------------------------------------------
+PROFILES = {
+    # direct audio URL for playback; the same extraction feeds /track_info and Up Next metadata
+    "stream": {
+        "quiet": True,
+        "format": "bestaudio[ext=m4a]/bestaudio/best",
+        "extract_flat": False,
+        "noplaylist": True,
+    },
+    # ytsearchN: listings and related videos without resolving every entry
+    "flat": {"quiet": True, "extract_flat": True, "skip_download": True},
+}
+
+YDL_MAX_USES = int(os.getenv("NEBULA_YDL_MAX_USES", "200"))
+
+
+# --------------------------------------------------
+# Pre-warmed YoutubeDL instances
+# --------------------------------------------------
+class YDLPool:
+    """Long-lived YoutubeDL objects per option profile.
+
+    ``checkout`` hands an instance to exactly one caller at a time, so the
+    extractor setup and HTTP/cookie state are reused instead of rebuilt on
+    every request. An instance is closed and replaced after ``max_uses``
+    jobs or as soon as a job using it raises.
+    """
+
+    def __init__(self, profiles: dict, max_uses: int, max_idle: int):
+        self.profiles = dict(profiles)
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self._idle = {name: [] for name in self.profiles}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.recycled = 0
+
+    def register(self, name: str, opts: dict):
+        with self._lock:
+            self.profiles[name] = opts
+            self._idle.setdefault(name, [])
+
+    def _new(self, profile: str):
+        # imported on first use (or by warm()): loading yt_dlp costs more than the rest of startup
+        import yt_dlp
+
+        ydl = yt_dlp.YoutubeDL(dict(self.profiles[profile]))
+        with self._lock:
+            self.created += 1
+        return [ydl, 0]
+
+    def _discard(self, slot):
+        with self._lock:
+            self.recycled += 1
+        try:
+            slot[0].close()
+        except Exception:
+            pass
+
+    def warm(self, profile: str = None, count: int = 1):
+        """Pre-build ``count`` idle instances (with the YouTube extractor loaded) per profile."""
+        for name in [profile] if profile else list(self.profiles):
+            for _ in range(count):
+                slot = self._new(name)
+                slot[0].get_info_extractor("Youtube")
+                self._checkin(name, slot)
+
+    def _checkin(self, profile: str, slot):
+        with self._lock:
+            idle = self._idle[profile]
+            if len(idle) < self.max_idle:
+                idle.append(slot)
+                return
+        self._discard(slot)
+
+    @contextmanager
+    def checkout(self, profile: str):
+        with self._lock:
+            idle = self._idle[profile]
+            slot = idle.pop() if idle else None
+        if slot is None:
+            slot = self._new(profile)
+        try:
+            yield slot[0]
+        except BaseException:
+            self._discard(slot)
+            raise
+        slot[1] += 1
+        if slot[1] >= self.max_uses:
+            self._discard(slot)
+        else:
+            self._checkin(profile, slot)
+
+    def close(self):
+        with self._lock:
+            slots = [slot for idle in self._idle.values() for slot in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for slot in slots:
+            self._discard(slot)
+
+    def stats(self) -> dict:
+        return {
+            "idle": {name: len(idle) for name, idle in self._idle.items()},
+            "created": self.created,
+            "recycled": self.recycled,
+        }
+
+
+ydl_pool = YDLPool(PROFILES, YDL_MAX_USES, max_idle=EXTRACT_WORKERS)
+
+
+def extract_info(url: str, profile: str):
+    with ydl_pool.checkout(profile) as ydl, timed("extract"):
+        return ydl.extract_info(url, download=False)
+
+
+upstream = Upstream(EXTRACT_TIMEOUT)
+
+
+async def extract(url: str, profile: str, timeout: float = None):
+    """Run ``extract_info`` for ``url`` with the named option profile on the shared extraction pool.
+
+    Calls are paced by ``upstream``'s token bucket, get its adaptive timeout,
+    and fail fast with UpstreamUnavailable while its breaker is open.
+    """
+    upstream.breaker.allow()
+    settled = False  # the breaker saw this call's outcome
+    try:
+        # background work never waits and leaves UPSTREAM_RESERVE tokens for users;
+        # a user request waits up to UPSTREAM_MAX_WAIT
+        if background.get():
+            acquired = await upstream.bucket.acquire(0, keep=UPSTREAM_RESERVE)
+        else:
+            acquired = await upstream.bucket.acquire(UPSTREAM_MAX_WAIT)
+        if not acquired:
+            if not background.get():
+                upstream.rate_limited += 1
+            raise ExtractorBusy("Too many requests to YouTube, try again shortly")
+        start = time.perf_counter()
+        try:
+            info = await pool.run(extract_info, url, profile, timeout=timeout or upstream.timeout.current())
+        except ExtractorBusy:
+            raise
+        except Exception as e:
+            settled = True
+            upstream.breaker.record(not is_video_error(e), time.perf_counter() - start)
+            raise
+        settled = True
+        elapsed = time.perf_counter() - start
+        upstream.breaker.record(False, elapsed)
+        upstream.timeout.observe(elapsed)
+        return info
+    finally:
+        # never reached YouTube, or cancelled (client gone, shutdown): free a half-open probe slot
+        if not settled:
+            upstream.breaker.release()
+
+
+# --------------------------------------------------
+# Compact per-video metadata
+# --------------------------------------------------
+def stream_url_of(info: dict):
+    return info.get("url") or next((f.get("url") for f in info.get("formats", []) if f.get("url")), None)
+
+
+def compact_info(info: dict, video_id: str = None) -> dict:
+    """Keep only what the API serves from a full info dict (it drops the formats list and the rest)."""
+    url = stream_url_of(info)
+    return {
+        "videoId": info.get("id") or video_id,
+        "title": info.get("title"),
+        "uploader": info.get("uploader"),
+        "duration": info.get("duration"),
+        "thumbnail": info.get("thumbnail"),
+        "related": [
+            {"id": e.get("id"), "title": e.get("title"), "uploader": e.get("uploader")}
+            for e in info.get("related_videos") or []
+            if e.get("id")
+        ],
+        "url": url,
+        "ext": info.get("ext"),
+        "expire": url_expiry(url),
+    }
+
+
+# --------------------------------------------------
+# Video ID normalization
+# --------------------------------------------------
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def video_id_from_url(url: str):
+    """Return the 11-char video ID from a watch?v=, youtu.be, shorts/embed URL or bare ID."""
+    url = (url or "").strip()
+    if _VIDEO_ID.match(url):
+        return url
+    parsed = urlparse(url if "//" in url else f"https://{url}")
+    host = (parsed.hostname or "").lower()
+    if host == "youtu.be":
+        candidate = parsed.path.strip("/").split("/")[0]
+    elif host == "youtube.com" or host.endswith(".youtube.com"):
+        candidate = parse_qs(parsed.query).get("v", [""])[0]
+        if not candidate:
+            parts = parsed.path.strip("/").split("/")
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+                candidate = parts[1]
+    else:
+        return None
+    return candidate if _VIDEO_ID.match(candidate or "") else None
+
+
+def watch_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+# --------------------------------------------------
+# Single-flight (in-flight de-duplication)
+# --------------------------------------------------
+class SingleFlight:
+    """Lets concurrent callers with the same key share one running coroutine."""
+
+    def __init__(self):
+        self._inflight = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self._inflight
+
+    def start(self, key, coro_fn, *args) -> asyncio.Task:
+        """Start ``coro_fn(*args)`` for ``key`` unless one is already running; return its task."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    async def run(self, key, coro_fn, *args):
+        # shield: one caller disconnecting must not cancel the others' result
+        return await asyncio.shield(self.start(key, coro_fn, *args))
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
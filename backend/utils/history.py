@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from pathlib import Path
+
+from utils.metrics import timed
+
+logger = logging.getLogger("nebula-backend")
+
+# --------------------------------------------------
+# Play history settings
+# --------------------------------------------------
+PLAY_LOG = os.getenv("NEBULA_PLAY_LOG", "data/plays.log")
+RECENT_SIZE = 200
+TOP_K = 100  # longest top list kept up to date
+PLAY_DEDUPE = 30  # seconds; the same track reported twice within this is one play
+HOUR = 60 * 60
+WINDOWS = {
+    "day": (24 * HOUR, HOUR),  # span, bucket size
+    "week": (7 * 24 * HOUR, HOUR),
+    "all": (None, None),
+}
+
+
+def artist_key(name: str) -> str:
+    return " ".join((name or "").casefold().split())
+
+
+# --------------------------------------------------
+# Sliding-window counts with a maintained top-K
+# --------------------------------------------------
+class WindowedCounter:
+    """Counts per key over the last ``span`` seconds (all time if None).
+
+    Counts live in time buckets; expiring a bucket subtracts it from the
+    running totals. The top-K list is patched on every increment (O(K)) and
+    rebuilt with a heap selection only when a bucket expires, so reads are
+    a slice of an already sorted list.
+    """
+
+    def __init__(self, span: float = None, bucket_seconds: float = None, k: int = TOP_K):
+        self.span = span
+        self.bucket_seconds = bucket_seconds
+        self.k = k
+        self._buckets = deque()  # (bucket start, Counter)
+        self._totals = Counter()
+        self._top = []  # keys, highest count first
+
+    def add(self, key, ts: float):
+        self._expire(ts)
+        if self.span is not None:
+            start = ts - ts % self.bucket_seconds
+            if not self._buckets or self._buckets[-1][0] != start:
+                self._buckets.append((start, Counter()))
+            self._buckets[-1][1][key] += 1
+        self._totals[key] += 1
+        self._bump(key)
+
+    def _bump(self, key):
+        top, totals = self._top, self._totals
+        if key in top:
+            top.remove(key)
+        elif len(top) >= self.k and totals[key] <= totals[top[-1]]:
+            return
+        count = totals[key]
+        i = 0
+        while i < len(top) and totals[top[i]] >= count:
+            i += 1
+        top.insert(i, key)
+        del top[self.k:]
+
+    def _expire(self, now: float):
+        if self.span is None:
+            return
+        expired = False
+        while self._buckets and self._buckets[0][0] + self.bucket_seconds <= now - self.span:
+            _, counts = self._buckets.popleft()
+            self._totals.subtract(counts)
+            expired = True
+        if expired:
+            self._totals = +self._totals  # drop zero counts
+            self._top = [key for key, _ in self._totals.most_common(self.k)]
+
+    def top(self, now: float, limit: int):
+        self._expire(now)
+        return [(key, self._totals[key]) for key in self._top[:limit]]
+
+
+# --------------------------------------------------
+# Play history
+# --------------------------------------------------
+class PlayHistory:
+    """Play events in an append-only JSONL log, plus aggregates kept in memory.
+
+    Recently played tracks are an insertion-ordered dict capped at
+    ``RECENT_SIZE`` (a de-duplicating ring buffer); top tracks and artists
+    per window come from WindowedCounter. The log is replayed on first use
+    (normally during warm-up) to rebuild everything; ``listeners`` are called
+    with every play event, the replayed ones included.
+    """
+
+    def __init__(self, log_file: Path):
+        self.log_file = Path(log_file)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._log = None
+        self.version = 0
+        self.listeners = []
+        self._recent = OrderedDict()  # videoId -> last play ts, most recent last
+        self._tracks = {}  # videoId -> {"videoId", "title", "artist", "thumbnail"}
+        self._artists = {}  # artist key -> display name
+        self._artist_tracks = defaultdict(Counter)  # artist key -> videoId -> plays
+        self._tracks_top = {name: WindowedCounter(*spec) for name, spec in WINDOWS.items()}
+        self._artists_top = {name: WindowedCounter(*spec) for name, spec in WINDOWS.items()}
+
+    # ---------- loading ----------
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.log_file.exists():
+                return
+            with timed("json_io"), open(self.log_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        logger.warning(f"Skipping bad play log line in {self.log_file}")
+
+    def _apply(self, event: dict):
+        vid, ts = event["videoId"], event["t"]
+        track = self._tracks.get(vid, {})
+        self._tracks[vid] = {
+            "videoId": vid,
+            "title": event.get("title") or track.get("title"),
+            "artist": event.get("artist") or track.get("artist"),
+            "thumbnail": event.get("thumbnail") or track.get("thumbnail")
+            or f"https://img.youtube.com/vi/{vid}/hqdefault.jpg",
+        }
+        self._recent.pop(vid, None)
+        self._recent[vid] = ts
+        if len(self._recent) > RECENT_SIZE:
+            self._recent.popitem(last=False)
+        for counter in self._tracks_top.values():
+            counter.add(vid, ts)
+        artist = self._tracks[vid]["artist"]
+        key = artist_key(artist)
+        if key:
+            self._artists[key] = artist
+            self._artist_tracks[key][vid] += 1
+            for counter in self._artists_top.values():
+                counter.add(key, ts)
+        self.version += 1
+        for listener in self.listeners:
+            listener(event)
+
+    # ---------- recording ----------
+    def record(self, track: dict, ts: float = None) -> bool:
+        """Log one play of ``track``; returns False if it repeats the last play within PLAY_DEDUPE."""
+        self.load()
+        ts = ts or time.time()
+        with self._lock:
+            last = self._recent.get(track["videoId"])
+            if last is not None and ts - last < PLAY_DEDUPE and next(reversed(self._recent)) == track["videoId"]:
+                return False
+            event = {
+                "t": round(ts, 3),
+                "videoId": track["videoId"],
+                "title": track.get("title"),
+                "artist": track.get("artist"),
+                "thumbnail": track.get("thumbnail"),
+            }
+            if self._log is None:
+                self.log_file.parent.mkdir(parents=True, exist_ok=True)
+                self._log = open(self.log_file, "a", encoding="utf-8")
+            with timed("json_io"):
+                self._log.write(json.dumps(event) + "\n")
+                self._log.flush()
+            self._apply(event)
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    # ---------- reads ----------
+    def recent(self, limit: int = 50):
+        self.load()
+        with self._lock:
+            out = []
+            for vid in reversed(self._recent):
+                out.append(dict(self._tracks[vid]))
+                if len(out) >= limit:
+                    break
+            return out
+
+    def top_tracks(self, window: str = "week", limit: int = 50):
+        self.load()
+        with self._lock:
+            return [
+                dict(self._tracks[vid], plays=n)
+                for vid, n in self._tracks_top[window].top(time.time(), limit)
+            ]
+
+    def top_artists(self, window: str = "week", limit: int = 20):
+        self.load()
+        with self._lock:
+            return [
+                {"artist": self._artists[key], "plays": n}
+                for key, n in self._artists_top[window].top(time.time(), limit)
+            ]
+
+    def artist_tracks(self, artist: str, limit: int = 20):
+        """The artist's most played tracks (all time)."""
+        self.load()
+        with self._lock:
+            counts = self._artist_tracks.get(artist_key(artist), Counter())
+            return [dict(self._tracks[vid], plays=n) for vid, n in counts.most_common(limit)]
+
+
+history = PlayHistory(PLAY_LOG)
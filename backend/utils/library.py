@@ -0,0 +1,445 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+    from fcntl import LOCK_EX, LOCK_SH, LOCK_UN
+except ImportError:  # Windows: no cross-process lock, run a single worker
+    fcntl = None
+    LOCK_EX = LOCK_SH = LOCK_UN = 0
+
+from utils.metrics import timed
+
+logger = logging.getLogger("nebula-backend")
+
+# Journal entries written before the snapshot files are rewritten.
+COMPACT_EVERY = int(os.getenv("NEBULA_LIBRARY_COMPACT_EVERY", "500"))
+# Deleted playlists / unliked songs remembered for /library/changes.
+TOMBSTONE_MAX = 10000
+
+
+def _write_synced(path: Path, data: dict):
+    with timed("json_io"), open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_json(path: Path):
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return {}
+
+
+def _file_id(path: Path):
+    """Identity of the file at ``path``; changes when it is replaced (None if missing)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _section(entry: dict) -> str:
+    return "playlists" if entry["op"] in ("create", "add", "delete") else "liked"
+
+
+# --------------------------------------------------
+# Playlists + likes, in memory with an append-only journal
+# --------------------------------------------------
+class LibraryStore:
+    """Playlists and liked songs held in memory, indexed by playlist ID and videoId.
+
+    Each mutation is appended to ``journal_file`` as one JSON line. Once the
+    journal holds ``compact_every`` entries, a background thread writes the
+    full state back to ``playlists.json`` / ``liked_songs.json`` (same format
+    as before, temp file + rename) and drops the entries they now contain.
+
+    Several worker processes may share the files: every read holds a shared
+    and every mutation an exclusive lock on ``<journal>.lock``, and first
+    applies the journal lines other processes appended since (or reloads the
+    snapshots if another process compacted). Reads cost two ``stat`` calls
+    when nothing changed. Without ``fcntl`` (Windows) run a single worker.
+
+    Nothing is read until ``load()`` (warm-up) or the first call that needs
+    the data.
+
+    Every mutation bumps ``version``, which survives restarts (it is stored in
+    the snapshots and on each journal line). ``epoch`` names this store's
+    version sequence, so versions from a wiped or replaced library are never
+    mistaken for current ones. Per-item versions and tombstones let
+    ``changes(since)`` return only what changed after ``since``.
+    """
+
+    def __init__(self, playlists_file: Path, likes_file: Path, journal_file: Path,
+                 compact_every: int = COMPACT_EVERY):
+        self.playlists_file = Path(playlists_file)
+        self.likes_file = Path(likes_file)
+        self.journal_file = Path(journal_file)
+        self.lock_file = self.journal_file.with_name(self.journal_file.name + ".lock")
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        self._depth = 0  # nesting of _locked() in the thread holding self._lock
+        self._playlists = {}  # id -> {"id", "name", "songs": {videoId: song}}
+        self._liked = {}  # videoId -> song, in like order
+        self._journal = None
+        self._journal_id = None  # inode of the journal this process has read
+        self._offset = 0  # bytes of the journal applied
+        self._snapshot = None  # _file_id of the playlists snapshot loaded
+        self._base = {"playlists": 0, "liked": 0}  # snapshot versions; older journal lines are in them
+        self._pending = 0  # journal entries since the last compaction
+        self._compacting = False
+        self._generation = 0  # bumped whenever the snapshots change (reloaded, or compacted here)
+        self.version = 0
+        self.epoch = None
+        self._changed = {"playlists": {}, "liked": {}}  # id -> version of last add/modify
+        self._removed = {"playlists": OrderedDict(), "liked": OrderedDict()}  # tombstones, oldest first
+        self._section_version = {"playlists": 0, "liked": 0}
+        self._floor = 0  # oldest ``since`` that changes() can answer exactly
+        self._loaded = False
+
+    # ---------- locking ----------
+    def _flock(self, op):
+        if fcntl is not None:
+            fcntl.flock(self._lock_fd, op)
+
+    @contextmanager
+    def _locked(self, write: bool = False):
+        """Hold the store for a read (shared lock) or a mutation (exclusive), in sync with other processes."""
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            self._flock(LOCK_EX if write else LOCK_SH)
+            self._depth = 1
+            try:
+                self._sync()
+                yield
+            finally:
+                self._depth = 0
+                self._flock(LOCK_UN)
+
+    # ---------- loading ----------
+    def load(self):
+        """Read the snapshots and replay the journal; runs at warm-up or on first use."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            self._lock_fd = open(self.lock_file, "a")
+            self._flock(LOCK_EX)
+            self._depth = 1
+            try:
+                migrate = self._load()
+                if migrate or self._pending:
+                    self.compact()
+            finally:
+                self._depth = 0
+                self._flock(LOCK_UN)
+
+    def _load(self) -> bool:
+        """(Re)build everything from the snapshots and the journal; True if they predate versioning."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._snapshot = _file_id(self.playlists_file)
+        self._generation += 1
+        # the JSON files written by older versions are the initial snapshot
+        playlists, likes = _read_json(self.playlists_file), _read_json(self.likes_file)
+        self._playlists, self._liked = {}, {}
+        for pl in playlists.get("playlists", []):
+            self._apply({"op": "create", "id": pl["id"], "name": pl.get("name", "")})
+            for song in pl.get("songs", []):
+                self._apply({"op": "add", "id": pl["id"], "song": song})
+        for song in likes.get("liked", []):
+            self._apply({"op": "like", "song": song})
+        self._base = {"playlists": playlists.get("version", 0), "liked": likes.get("version", 0)}
+        self.version = max(self._base.values())
+        if not self.version and (self._playlists or self._liked):
+            # files from before versioning: their content is version 1, so since=0 gets it all
+            self.version = 1
+        self.epoch = playlists.get("epoch") or self.epoch or uuid.uuid4().hex[:12]
+        self._journal_id, self._offset, self._pending = None, 0, 0
+        self._read_journal()
+        # only changes made from here on are tracked per item
+        self._floor = self.version
+        self._changed = {"playlists": {}, "liked": {}}
+        self._removed = {"playlists": OrderedDict(), "liked": OrderedDict()}
+        self._section_version = {"playlists": self.version, "liked": self.version}
+        return "version" not in playlists
+
+    def _sync(self):
+        """Catch up with what other processes wrote since this one last looked."""
+        journal = _file_id(self.journal_file)
+        replaced = self._offset and (journal is None or journal[0] != self._journal_id or journal[2] < self._offset)
+        if _file_id(self.playlists_file) != self._snapshot or replaced:
+            self._load()  # another process compacted
+        elif journal is not None and journal[2] > self._offset:
+            self._read_journal()
+
+    def _read_journal(self):
+        """Apply the complete journal lines after ``_offset``; a line still being written waits."""
+        try:
+            f = open(self.journal_file, "rb")
+        except FileNotFoundError:
+            return
+        with timed("json_io"), f:
+            self._journal_id = os.fstat(f.fileno()).st_ino
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+                self._pending += 1
+                v = entry.get("v")
+                if v is not None and v <= self._base[_section(entry)]:
+                    continue  # already in the snapshot (a compaction stopped before dropping it)
+                self._apply(entry)
+                self.version = max(self.version, v) if v is not None else self.version + 1
+                self._track(entry)
+            except (ValueError, KeyError):
+                # a torn line from a crash mid-write
+                logger.warning(f"Skipping bad journal line in {self.journal_file}")
+
+    def _apply(self, entry: dict):
+        op = entry["op"]
+        if op == "create":
+            self._playlists.setdefault(entry["id"], {"id": entry["id"], "name": entry["name"], "songs": {}})
+        elif op == "delete":
+            self._playlists.pop(entry["id"], None)
+        elif op == "add":
+            pl = self._playlists.get(entry["id"])
+            song = entry["song"]
+            if pl is not None and song.get("videoId") not in pl["songs"]:
+                pl["songs"][song.get("videoId")] = song
+        elif op == "like":
+            self._liked.setdefault(entry["song"]["videoId"], entry["song"])
+        elif op == "unlike":
+            self._liked.pop(entry["videoId"], None)
+        else:
+            raise KeyError(op)
+
+    # ---------- persistence ----------
+    def _track(self, entry: dict):
+        section, op = _section(entry), entry["op"]
+        if section == "playlists":
+            key, removed = entry["id"], op == "delete"
+        else:
+            key, removed = (entry["song"]["videoId"] if op == "like" else entry["videoId"]), op == "unlike"
+        self._section_version[section] = self.version
+        tombstones = self._removed[section]
+        if removed:
+            self._changed[section].pop(key, None)
+            tombstones.pop(key, None)
+            tombstones[key] = self.version
+            if len(tombstones) > TOMBSTONE_MAX:
+                _, oldest = tombstones.popitem(last=False)
+                self._floor = max(self._floor, oldest)
+        else:
+            tombstones.pop(key, None)
+            self._changed[section][key] = self.version
+
+    def _log(self, entry: dict):
+        """Apply and journal one mutation; the caller holds ``_locked(write=True)``."""
+        self._apply(entry)
+        self.version += 1
+        entry = dict(entry, v=self.version)
+        self._track(entry)
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        if self._journal is None:
+            self._journal = open(self.journal_file, "ab")
+            self._journal_id = os.fstat(self._journal.fileno()).st_ino
+        with timed("json_io"):
+            if os.fstat(self._journal.fileno()).st_size > self._offset:
+                self._journal.truncate(self._offset)  # the torn tail of a writer that crashed
+            self._journal.write(line)
+            self._journal.flush()
+        self._offset += len(line)
+        self._pending += 1
+        if self._pending >= self.compact_every and not self._compacting:
+            # the snapshot write and fsync stay off the request path
+            self._compacting = True
+            threading.Thread(target=self._compact_in_background, name="library-compact", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.warning(f"Library compaction failed: {e}")
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """Write full snapshots atomically, then drop the journal entries they contain.
+
+        The snapshots are written without holding the lock; if another process
+        compacted meanwhile, this one's snapshots are discarded.
+        """
+        with self._locked(write=True):
+            generation, cut, version = self._generation, self._offset, self.version
+            playlists = {
+                "playlists": [self._playlist_dict(pl) for pl in self._playlists.values()],
+                "version": version, "epoch": self.epoch,
+            }
+            likes = {"liked": list(self._liked.values()), "version": version}
+        suffix = f".{os.getpid()}.tmp"
+        tmp_playlists = self.playlists_file.with_name(self.playlists_file.name + suffix)
+        tmp_likes = self.likes_file.with_name(self.likes_file.name + suffix)
+        _write_synced(tmp_playlists, playlists)
+        _write_synced(tmp_likes, likes)
+        with self._locked(write=True):
+            if self._generation != generation:
+                # another process (or a newer compaction here) got there first
+                tmp_playlists.unlink(missing_ok=True)
+                tmp_likes.unlink(missing_ok=True)
+                return
+            # likes first: a crash in between leaves the old playlists snapshot, and the
+            # journal lines above each snapshot's version are replayed over it
+            os.replace(tmp_likes, self.likes_file)
+            os.replace(tmp_playlists, self.playlists_file)
+            self._snapshot = _file_id(self.playlists_file)
+            self._generation += 1
+            self._base = {"playlists": version, "liked": version}
+            self._drop_journal_head(cut)
+
+    def _drop_journal_head(self, cut: int):
+        """Keep only the journal bytes after ``cut`` (already in the snapshots)."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        tail = b""
+        if self._offset > cut:
+            with open(self.journal_file, "rb") as f:
+                f.seek(cut)
+                tail = f.read(self._offset - cut)
+        if tail:
+            tmp = self.journal_file.with_name(self.journal_file.name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journal_file)
+            self._journal_id = _file_id(self.journal_file)[0]
+        else:
+            self.journal_file.unlink(missing_ok=True)
+            self._journal_id = None
+        self._offset = len(tail)
+        self._pending = tail.count(b"\n")
+
+    def close(self):
+        if not self._loaded:
+            return
+        with self._lock:
+            if self._pending:
+                self.compact()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    # ---------- versions ----------
+    def etag(self, section: str) -> str:
+        """ETag for ``"playlists"`` or ``"liked"``; changes only when that section does."""
+        with self._locked():
+            return f'"{self.epoch}-{self._section_version[section]}"'
+
+    def changes(self, since: int, epoch: str = None) -> dict:
+        """Playlists and likes added, modified or removed after version ``since``.
+
+        If ``since`` is older than what is tracked (or from another epoch) the
+        whole library is returned with ``"full": True`` instead.
+        """
+        with self._locked():
+            out = {"epoch": self.epoch, "version": self.version}
+            if (epoch and epoch != self.epoch) or since < self._floor or since > self.version:
+                out.update(full=True, playlists=self.all_playlists(), liked=self.all_likes())
+                return out
+            changed, removed = self._changed, self._removed
+            out.update(
+                full=False,
+                playlists={
+                    "upserted": [
+                        self._playlist_dict(self._playlists[pid])
+                        for pid, v in changed["playlists"].items() if v > since
+                    ],
+                    "deleted": [pid for pid, v in removed["playlists"].items() if v > since],
+                },
+                liked={
+                    "added": [self._liked[vid] for vid, v in changed["liked"].items() if v > since],
+                    "removed": [vid for vid, v in removed["liked"].items() if v > since],
+                },
+            )
+            return out
+
+    # ---------- playlists ----------
+    @staticmethod
+    def _playlist_dict(pl: dict) -> dict:
+        return {"id": pl["id"], "name": pl["name"], "songs": list(pl["songs"].values())}
+
+    def all_playlists(self):
+        with self._locked():
+            return [self._playlist_dict(pl) for pl in self._playlists.values()]
+
+    def playlist_songs(self, playlist_id):
+        with self._locked():
+            pl = self._playlists.get(playlist_id)
+            return list(pl["songs"].values()) if pl else []
+
+    def create_playlist(self, name: str) -> dict:
+        with self._locked(write=True):
+            new_id = max(self._playlists, default=0) + 1
+            self._log({"op": "create", "id": new_id, "name": name})
+            return {"id": new_id, "name": name, "songs": []}
+
+    def add_song(self, playlist_id, song: dict):
+        """Return True if added, False if already present, None if the playlist does not exist."""
+        with self._locked(write=True):
+            pl = self._playlists.get(playlist_id)
+            if pl is None:
+                return None
+            if song["videoId"] in pl["songs"]:
+                return False
+            self._log({"op": "add", "id": playlist_id, "song": song})
+            return True
+
+    def delete_playlist(self, playlist_id):
+        with self._locked(write=True):
+            if playlist_id in self._playlists:
+                self._log({"op": "delete", "id": playlist_id})
+
+    # ---------- likes ----------
+    def all_likes(self):
+        with self._locked():
+            return list(self._liked.values())
+
+    def is_liked(self, video_id: str) -> bool:
+        with self._locked():
+            return video_id in self._liked
+
+    def toggle_like(self, song: dict) -> bool:
+        """Like ``song`` or unlike it if it is already liked; return the new state."""
+        with self._locked(write=True):
+            if song["videoId"] in self._liked:
+                self._log({"op": "unlike", "videoId": song["videoId"]})
+                return False
+            self._log({"op": "like", "song": song})
+            return True
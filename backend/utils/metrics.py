@@ -0,0 +1,177 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("nebula-backend")
+
+# Requests slower than this are logged with their stage breakdown (0 disables).
+SLOW_REQUEST_MS = float(os.getenv("NEBULA_SLOW_REQUEST_MS", "0"))
+# Fraction of slow requests that get logged.
+SLOW_REQUEST_SAMPLE = float(os.getenv("NEBULA_SLOW_REQUEST_SAMPLE", "1.0"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (stage, seconds) pairs recorded during the current request, if any
+_stages = contextvars.ContextVar("nebula_stages", default=None)
+
+
+def _labels(names, values) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return ",".join(pairs)
+
+
+# --------------------------------------------------
+# Histogram (Prometheus text format)
+# --------------------------------------------------
+class Histogram:
+    """Cumulative-bucket latency histogram with a fixed set of label names."""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(v[0]), v[1], v[2]) for k, v in self._series.items())
+        for values, counts, total, count in series:
+            base = _labels(self.labels, values)
+            sep = "," if base else ""
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "nebula_http_request_duration_seconds",
+    "Time until the response starts, by route template.",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "nebula_stage_duration_seconds",
+    "Time spent in internal stages (extraction, upstream HTTP, JSON I/O, DB).",
+    ("stage",),
+)
+_histograms = [REQUEST_SECONDS, STAGE_SECONDS]
+_collectors = []
+
+
+@contextmanager
+def timed(stage: str):
+    """Record the block's duration under ``stage`` and in the current request's breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        stages = _stages.get()
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    stages = _stages.get()
+    if stages is not None:
+        stages.append((stage, seconds))
+
+
+def collector(fn):
+    """Register ``fn() -> [(name, type, help, [(labels dict, value)])]``, called on every scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    lines = []
+    for histogram in _histograms:
+        lines.extend(histogram.render())
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception as e:
+            logger.warning(f"Metrics collector {fn.__name__} failed: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                base = _labels(labels.keys(), labels.values())
+                lines.append(f"{name}{{{base}}} {value}" if base else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------
+# ASGI middleware
+# --------------------------------------------------
+class MetricsMiddleware:
+    """Times every HTTP request up to the start of its response.
+
+    Streaming bodies (audio) are deliberately not included; the label is the
+    matched route template so ``/stream/audio/{videoId}`` stays one series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        stages = []
+        token = _stages.set(stages)
+        status = {"code": 500, "done": False}
+
+        def finish():
+            if status["done"]:
+                return
+            status["done"] = True
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(elapsed, scope["method"], path, status["code"])
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS and random.random() < SLOW_REQUEST_SAMPLE:
+                breakdown = ", ".join(f"{name}={secs * 1000:.1f}ms" for name, secs in stages) or "no stages"
+                logger.warning(
+                    f"Slow request {scope['method']} {scope['path']} {status['code']} "
+                    f"{elapsed * 1000:.1f}ms: {breakdown}"
+                )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+            _stages.reset(token)
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from utils.extractor import background, pool, upstream, ExtractorBusy, UpstreamUnavailable
+
+logger = logging.getLogger("nebula-backend")
+
+# --------------------------------------------------
+# Prefetch settings
+# --------------------------------------------------
+PREFETCH_COUNT = int(os.getenv("NEBULA_PREFETCH_COUNT", "5"))
+# Up Next tracks stay "active" (kept warm) this long after the list was served.
+PREFETCH_SESSION_TTL = 60 * 30
+# Re-resolve an active track's stream URL when it has less than this left.
+PREFETCH_REFRESH_AHEAD = 60 * 10
+
+
+# --------------------------------------------------
+# Low-priority background warm-up
+# --------------------------------------------------
+class Prefetcher:
+    """Warms stream URLs / metadata for upcoming tracks in the background.
+
+    ``warm(video_id)`` runs under the extractor's ``background`` flag and only
+    while the extraction pool has a spare worker and the upstream rate limiter
+    holds more than its reserve of tokens, so it never delays a user request.
+    Tracks stay active for ``session_ttl`` after they were last queued; while
+    active, ``remaining(video_id)`` is polled and the track is warmed again
+    before its cached URL runs out.
+    """
+
+    def __init__(self, warm, remaining, session_ttl: float = PREFETCH_SESSION_TTL,
+                 refresh_ahead: float = PREFETCH_REFRESH_AHEAD):
+        self.warm = warm
+        self.remaining = remaining
+        self.session_ttl = session_ttl
+        self.refresh_ahead = refresh_ahead
+        self._queue = deque()
+        self._queued = set()
+        self._active = {}  # video_id -> last time it was queued by a listener
+        self._wakeup = None
+        self._tasks = []
+        self.warmed = 0
+        self.skipped = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, video_ids, touch: bool = True):
+        now = time.time()
+        for vid in video_ids:
+            if not vid:
+                continue
+            if touch:
+                self._active[vid] = now
+            if vid not in self._queued:
+                self._queued.add(vid)
+                self._queue.append(vid)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._drain()), asyncio.create_task(self._refresh())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _drain(self):
+        background.set(True)
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not pool.has_background_capacity() or not upstream.has_background_tokens():
+                # a worker or the rate limiter's reserve is needed for users
+                await asyncio.sleep(0.25)
+                continue
+            vid = self._queue.popleft()
+            self._queued.discard(vid)
+            if self.remaining(vid) > self.refresh_ahead:
+                self.skipped += 1
+                continue
+            try:
+                await self.warm(vid)
+                self.warmed += 1
+            except ExtractorBusy:
+                # a user request took the spare worker; try again later
+                self.enqueue([vid], touch=False)
+                await asyncio.sleep(0.25)
+            except UpstreamUnavailable as e:
+                # YouTube is unhealthy: keep the track queued and pause until the breaker may close
+                self.enqueue([vid], touch=False)
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.warning(f"Prefetch failed for {vid}: {e}")
+
+    async def _refresh(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for vid, last_seen in list(self._active.items()):
+                if now - last_seen > self.session_ttl:
+                    del self._active[vid]
+                elif self.remaining(vid) <= self.refresh_ahead:
+                    self.enqueue([vid], touch=False)
@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+# --------------------------------------------------
+# Signal weights
+# --------------------------------------------------
+PLAYLIST_WEIGHT = 1.0  # two songs in the same playlist (within PLAYLIST_WINDOW positions)
+LIKE_WEIGHT = 0.3  # two songs liked close together (within LIKE_WINDOW likes)
+PLAY_WEIGHT = 2.0  # one song played right after the other
+PLAYLIST_WINDOW = 50
+LIKE_WINDOW = 10
+PLAY_GAP = 60 * 30  # plays further apart than this are not a sequence
+HISTORY_DECAY = 0.5  # weight of each earlier play when scoring
+
+
+# --------------------------------------------------
+# Item-item co-occurrence recommender
+# --------------------------------------------------
+class Recommender:
+    """Up Next from our own listening signal instead of a remote extraction.
+
+    Items get dense integer indices; co-occurrence counts are stored sparsely
+    as one ``{index: weight}`` row per item, and updated incrementally as
+    playlists, likes and plays come in (and taken back out when a song is
+    unliked or a playlist deleted). Scoring gathers the rows of the seed
+    tracks into NumPy arrays, normalises by item popularity (cosine-style),
+    and accumulates everything in one dense score vector.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = {}  # videoId -> int
+        self._ids = []  # int -> videoId
+        self._tracks = {}  # videoId -> {"videoId", "title", "artist", "thumbnail"}
+        self._rows = defaultdict(dict)  # int -> {int: weight}
+        self._pop = np.zeros(256)
+        self._recent_likes = deque(maxlen=LIKE_WINDOW)
+        self._like_links = defaultdict(set)  # int -> indices it was linked to by liking
+        self._history = deque(maxlen=5)  # (index, played_at)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ---------- indexing ----------
+    def _idx(self, track: dict) -> int:
+        vid = track["videoId"]
+        if track.get("title"):
+            self._tracks[vid] = {
+                "videoId": vid,
+                "title": track.get("title"),
+                "artist": track.get("artist"),
+                "thumbnail": track.get("thumbnail") or f"https://img.youtube.com/vi/{vid}/hqdefault.jpg",
+            }
+        i = self._index.get(vid)
+        if i is None:
+            i = len(self._ids)
+            self._index[vid] = i
+            self._ids.append(vid)
+            if i >= len(self._pop):
+                self._pop = np.concatenate([self._pop, np.zeros(len(self._pop))])
+        return i
+
+    def _link(self, a: int, b: int, weight: float):
+        if a == b:
+            return
+        self._rows[a][b] = self._rows[a].get(b, 0.0) + weight
+        self._rows[b][a] = self._rows[b].get(a, 0.0) + weight
+        self._pop[a] += weight
+        self._pop[b] += weight
+
+    def _unlink(self, a: int, b: int, weight: float):
+        if a == b:
+            return
+        for x, y in ((a, b), (b, a)):
+            row = self._rows.get(x)
+            if row is None or y not in row:
+                continue
+            w = min(weight, row[y])
+            row[y] -= w
+            if row[y] <= 1e-9:
+                del row[y]
+            if not row:
+                del self._rows[x]
+            self._pop[x] = max(0.0, self._pop[x] - w)
+
+    # ---------- signals ----------
+    def build(self, playlists, liked):
+        """Seed the model from the current library."""
+        for pl in playlists:
+            songs = [s for s in pl.get("songs", []) if s.get("videoId")]
+            for pos, song in enumerate(songs):
+                self.observe_playlist_add(songs[max(0, pos - PLAYLIST_WINDOW):pos], song)
+        for song in liked:
+            if song.get("videoId"):
+                self.observe_like(song)
+
+    def observe_playlist_add(self, existing, song: dict):
+        """``song`` was appended to a playlist that already holds ``existing``."""
+        with self._lock:
+            new = self._idx(song)
+            for other in list(existing)[-PLAYLIST_WINDOW:]:
+                if other.get("videoId"):
+                    self._link(new, self._idx(other), PLAYLIST_WEIGHT)
+
+    def observe_like(self, song: dict):
+        with self._lock:
+            new = self._idx(song)
+            for other in self._recent_likes:
+                if other != new and other not in self._like_links[new]:
+                    self._link(new, other, LIKE_WEIGHT)
+                    self._like_links[new].add(other)
+                    self._like_links[other].add(new)
+            self._recent_likes.append(new)
+
+    def forget_like(self, video_id: str):
+        """``video_id`` was unliked: drop the links its like made."""
+        with self._lock:
+            i = self._index.get(video_id)
+            if i is None:
+                return
+            for other in self._like_links.pop(i, ()):
+                self._unlink(i, other, LIKE_WEIGHT)
+                self._like_links[other].discard(i)
+            self._recent_likes = deque((x for x in self._recent_likes if x != i), maxlen=LIKE_WINDOW)
+
+    def forget_playlist(self, songs):
+        """A playlist holding ``songs`` was deleted: undo what adding them linked."""
+        songs = [s for s in songs if s.get("videoId")]
+        with self._lock:
+            for pos, song in enumerate(songs):
+                i = self._index.get(song["videoId"])
+                if i is None:
+                    continue
+                for other in songs[max(0, pos - PLAYLIST_WINDOW):pos]:
+                    j = self._index.get(other["videoId"])
+                    if j is not None:
+                        self._unlink(i, j, PLAYLIST_WEIGHT)
+
+    def observe_play(self, video_id: str, track: dict = None, played_at: float = None):
+        with self._lock:
+            now = played_at or time.time()
+            current = self._idx(track or {"videoId": video_id})
+            if self._history:
+                prev, prev_at = self._history[-1]
+                if prev != current and now - prev_at < PLAY_GAP:
+                    self._link(prev, current, PLAY_WEIGHT)
+            self._history.append((current, now))
+
+    # ---------- scoring ----------
+    def recommend(self, video_id: str, k: int = 20):
+        """Top-``k`` tracks for ``video_id`` (recent plays count too, with decaying weight)."""
+        with self._lock:
+            seed = self._index.get(video_id)
+            if seed is None or not self._rows.get(seed):
+                return []
+            n = len(self._ids)
+            scores = np.zeros(n)
+            seeds = [(seed, 1.0)]
+            weight = HISTORY_DECAY
+            for idx, _ in reversed(self._history):
+                if idx != seed:
+                    seeds.append((idx, weight))
+                    weight *= HISTORY_DECAY
+
+            pop = self._pop[:n]
+            for idx, w in seeds:
+                row = self._rows.get(idx)
+                if not row:
+                    continue
+                cols = np.fromiter(row.keys(), dtype=np.int64, count=len(row))
+                vals = np.fromiter(row.values(), dtype=np.float64, count=len(row))
+                np.add.at(scores, cols, w * vals / np.sqrt(pop[idx] * pop[cols]))
+
+            excluded = [idx for idx, _ in seeds]
+            scores[excluded] = 0.0
+            # only items we can describe to the client
+            candidates = np.flatnonzero(scores > 0)
+            if candidates.size == 0:
+                return []
+            top = candidates[np.argsort(-scores[candidates], kind="stable")]
+            results = []
+            for i in top:
+                track = self._tracks.get(self._ids[i])
+                if track:
+                    results.append(dict(track))
+                    if len(results) >= k:
+                        break
+            return results
+
+
+recommender = Recommender()
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from fastapi.responses import FileResponse, Response
+
+logger = logging.getLogger("nebula-backend")
+
+# Vite names bundles like assets/index-BxY1z_9a.js: the hash changes with the content
+HASHED_NAME = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+COMPRESSIBLE = (".js", ".mjs", ".css", ".html", ".svg", ".json", ".txt", ".map", ".xml", ".webmanifest")
+# files without a .gz next to them are gzipped once at startup, up to this size
+GZIP_IN_MEMORY_MAX = 2 * 1024 * 1024
+
+
+def _accepts(header: str, coding: str) -> bool:
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() in (coding, "*"):
+            q = params.strip()
+            try:
+                return not (q.startswith("q=") and float(q[2:] or 0) == 0)
+            except ValueError:
+                return False
+    return False
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # weak comparison: W/"x" matches "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class StaticFile:
+    __slots__ = ("path", "media_type", "etag", "cache_control", "variants")
+
+    def __init__(self, path: Path, etag: str, cache_control: str):
+        self.path = path
+        self.media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.etag = etag
+        self.cache_control = cache_control
+        self.variants = {}  # "br" / "gzip" -> Path on disk, or bytes compressed at startup
+
+
+# --------------------------------------------------
+# Built frontend (Vite dist/)
+# --------------------------------------------------
+class StaticSite:
+    """Serves a built single-page app from an index made once at startup.
+
+    Hashed bundles get a year-long immutable Cache-Control; everything else
+    (index.html, favicon, ...) is revalidated by content ETag. Precompressed
+    ``.br`` / ``.gz`` files next to an asset are picked by Accept-Encoding,
+    and compressible files without a ``.gz`` are gzipped once in memory.
+    Unknown paths fall back to index.html unless they look like an asset.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._files = {}  # url path ("assets/x.js") -> StaticFile
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def build(self):
+        files = {}
+        if self.root.is_dir():
+            for dirpath, _, names in os.walk(self.root):
+                for name in names:
+                    if name.endswith((".gz", ".br")):
+                        continue
+                    path = Path(dirpath) / name
+                    rel = path.relative_to(self.root).as_posix()
+                    files[rel] = self._entry(rel, path)
+        self._files = files
+        logger.info(f"Indexed {len(files)} frontend files from {self.root}")
+
+    def _entry(self, rel: str, path: Path) -> StaticFile:
+        data = path.read_bytes()
+        etag = '"' + hashlib.sha1(data).hexdigest()[:20] + '"'
+        immutable = rel.startswith("assets/") and HASHED_NAME.search(rel)
+        entry = StaticFile(path, etag, IMMUTABLE if immutable else REVALIDATE)
+        for coding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = path.with_name(path.name + suffix)
+            if variant.is_file():
+                entry.variants[coding] = variant
+        if "gzip" not in entry.variants and path.suffix in COMPRESSIBLE and 1024 < len(data) <= GZIP_IN_MEMORY_MAX:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                entry.variants["gzip"] = compressed
+        return entry
+
+    @property
+    def index_html(self):
+        return self._files.get("index.html")
+
+    def lookup(self, url_path: str):
+        return self._files.get(url_path.lstrip("/"))
+
+    @staticmethod
+    def is_asset_path(url_path: str) -> bool:
+        """Paths that must 404 when missing instead of getting index.html."""
+        url_path = url_path.lstrip("/")
+        return url_path.startswith("assets/") or "." in url_path.rsplit("/", 1)[-1]
+
+    def respond(self, entry: StaticFile, headers) -> Response:
+        coding = None
+        accept = headers.get("accept-encoding", "")
+        for candidate in ("br", "gzip"):
+            if candidate in entry.variants and _accepts(accept, candidate):
+                coding = candidate
+                break
+        # each encoding is a different representation, so it gets its own tag
+        etag = entry.etag if coding is None else f'{entry.etag[:-1]}-{coding}"'
+        out = {"etag": etag, "cache-control": entry.cache_control}
+        if entry.variants:
+            out["vary"] = "Accept-Encoding"
+
+        if etag_matches(headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=out)
+        if coding is None:
+            return FileResponse(entry.path, media_type=entry.media_type, headers=out)
+        out["content-encoding"] = coding
+        variant = entry.variants[coding]
+        if isinstance(variant, bytes):
+            return Response(variant, media_type=entry.media_type, headers=out)
+        return FileResponse(variant, media_type=entry.media_type, headers=out)
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+# --------------------------------------------------
+# Upstream (YouTube) health settings
+# --------------------------------------------------
+UPSTREAM_RATE = float(os.getenv("NEBULA_UPSTREAM_RATE", "5"))  # extractions per second
+UPSTREAM_BURST = int(os.getenv("NEBULA_UPSTREAM_BURST", "10"))
+UPSTREAM_MAX_WAIT = float(os.getenv("NEBULA_UPSTREAM_MAX_WAIT", "2"))  # longest a request waits for a token
+# tokens background work (prefetch, warm-up) must leave in the bucket for user requests
+UPSTREAM_RESERVE = float(os.getenv("NEBULA_UPSTREAM_RESERVE", str(UPSTREAM_BURST / 2)))
+
+BREAKER_WINDOW = 60  # seconds of outcomes considered
+BREAKER_MIN_CALLS = int(os.getenv("NEBULA_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("NEBULA_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("NEBULA_BREAKER_SLOW_SECONDS", "8"))
+BREAKER_SLOW_RATE = float(os.getenv("NEBULA_BREAKER_SLOW_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("NEBULA_BREAKER_COOLDOWN", "30"))
+
+TIMEOUT_MIN = 5.0
+TIMEOUT_FACTOR = 3.0  # timeout = factor * p95 of recent successful extractions
+TIMEOUT_SAMPLES = 200
+
+# Failures about one video (not about YouTube's health) never trip the breaker.
+_VIDEO_ERRORS = (
+    "video unavailable",
+    "private video",
+    "unsupported url",
+    "is not a valid url",
+    "sign in to confirm your age",
+    "has been removed",
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised while the circuit breaker is open (YouTube is failing or too slow)."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_video_error(exc: BaseException) -> bool:
+    message = str(exc).lower()
+    return any(marker in message for marker in _VIDEO_ERRORS)
+
+
+# --------------------------------------------------
+# Token bucket
+# --------------------------------------------------
+class TokenBucket:
+    """Paces calls to ``rate`` per second with bursts of up to ``burst``.
+
+    A caller that finds the bucket empty reserves the next token (the count
+    goes negative) and sleeps until it is due, so waiting callers are served
+    in arrival order. A caller passing ``keep`` only gets a token if at least
+    that many would be left, and never waits.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, max_wait: float, keep: float = 0):
+        """Take a token; return the seconds to wait for it, or None if that exceeds ``max_wait``."""
+        with self._lock:
+            self._refill()
+            if keep and self._tokens - 1 < keep:
+                return None
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    async def acquire(self, max_wait: float, keep: float = 0) -> bool:
+        wait = self._reserve(max_wait, keep)
+        if wait is None:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def available(self) -> float:
+        """Tokens in the bucket right now (refilled up to the present)."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+# --------------------------------------------------
+# Circuit breaker
+# --------------------------------------------------
+class CircuitBreaker:
+    """closed -> open when, over the last ``window`` seconds and at least
+    ``min_calls`` calls, the error rate or the share of slow calls reaches its
+    threshold. After ``cooldown`` one probe is let through (half-open): a fast
+    success closes the breaker, anything else opens it again.
+    """
+
+    def __init__(self, window: float, min_calls: int, error_rate: float,
+                 slow_seconds: float, slow_rate: float, cooldown: float):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened = 0  # times tripped
+        self._opened_at = 0.0
+        self._probing = False
+        self._calls = deque()  # (monotonic time, failed, slow)
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        return max(1.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def allow(self):
+        """Raise UpstreamUnavailable unless a call may go upstream now."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() < self._opened_at + self.cooldown:
+                    raise UpstreamUnavailable("YouTube is failing, serving cached data only", self.retry_after())
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    raise UpstreamUnavailable("Waiting for a probe request to YouTube", 1.0)
+                self._probing = True
+
+    def release(self):
+        """The admitted call never reached upstream (e.g. the local pool was full)."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, failed: bool, seconds: float):
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half_open":
+                self._probing = False
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self.state = "closed"
+                    self._calls.clear()
+                return
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            n = len(self._calls)
+            if self.state == "closed" and n >= self.min_calls:
+                failures = sum(1 for _, f, _ in self._calls if f)
+                slows = sum(1 for _, _, s in self._calls if s)
+                if failures / n >= self.error_rate or slows / n >= self.slow_rate:
+                    self._trip(now)
+
+    def _trip(self, now: float):
+        self.state = "open"
+        self.opened += 1
+        self._opened_at = now
+        self._calls.clear()
+
+
+# --------------------------------------------------
+# Adaptive timeout
+# --------------------------------------------------
+class AdaptiveTimeout:
+    """Per-request deadline derived from recent successful extraction times."""
+
+    def __init__(self, minimum: float, maximum: float, factor: float = TIMEOUT_FACTOR, samples: int = TIMEOUT_SAMPLES):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self._samples = deque(maxlen=samples)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def current(self) -> float:
+        if len(self._samples) < 20:
+            return self.maximum
+        ordered = sorted(self._samples)
+        p95 = ordered[int(len(ordered) * 0.95) - 1]
+        return min(self.maximum, max(self.minimum, p95 * self.factor))
+
+
+class Upstream:
+    """Rate limiter + breaker + adaptive timeout in front of every extraction."""
+
+    def __init__(self, max_timeout: float):
+        self.bucket = TokenBucket(UPSTREAM_RATE, UPSTREAM_BURST)
+        self.breaker = CircuitBreaker(
+            BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_ERROR_RATE,
+            BREAKER_SLOW_SECONDS, BREAKER_SLOW_RATE, BREAKER_COOLDOWN,
+        )
+        self.timeout = AdaptiveTimeout(min(TIMEOUT_MIN, max_timeout), max_timeout)
+        self.rate_limited = 0
+
+    def has_background_tokens(self) -> bool:
+        return self.bucket.available() - 1 >= UPSTREAM_RESERVE
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "opened": self.breaker.opened,
+            "timeout": round(self.timeout.current(), 2),
+            "tokens": round(self.bucket.tokens, 2),
+            "rate_limited": self.rate_limited,
+        }
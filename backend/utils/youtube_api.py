@@ -1,11 +1,16 @@
 import requests, os
-from dotenv import load_dotenv
+from functools import lru_cache
 
-load_dotenv()
-YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+@lru_cache(maxsize=1)
+def api_key():
+    # .env is read on first use instead of at import
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return os.getenv("YOUTUBE_API_KEY")
 
 def search_youtube(query):
-    url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&q={query}&type=video&maxResults=10&key={YOUTUBE_API_KEY}"
+    url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&q={query}&type=video&maxResults=10&key={api_key()}"
     res = requests.get(url)
     data = res.json()
     results = []